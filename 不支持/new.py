@@ -1,6 +1,10 @@
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, TextIO, Union
+
+import numpy as np
 from transformers import AutoTokenizer
+from 分块.chunk_spans import ChunkSpans
+from 分块.parallel import parallel_map
 
 
 class TokenizerChunker:
@@ -18,9 +22,18 @@ class TokenizerChunker:
         self.chunk_overlap = chunk_overlap
         self.strip_whitespace = strip_whitespace
 
-    def split_text_with_indices(self, text: str, return_overlap: bool = False) -> List[Dict[str, Any]]:
+    def split_text_with_indices(
+        self,
+        text: str,
+        return_overlap: bool = False,
+        as_arrays: bool = False,
+        as_spans: bool = False,
+    ) -> Union[List[Dict[str, Any]], Dict[str, np.ndarray], ChunkSpans]:
         """
         切分文本，返回每个 chunk 的内容和在原文中的字符索引。
+        as_arrays=True 时返回紧凑的数组形式 {"start", "end", "main_start", "main_end"}，
+        不生成 chunk 文本。
+        as_spans=True 时返回共享原文的 ChunkSpans，按需切出文本，下标 / 迭代得到的 dict 与默认输出一致。
         """
         # === Step 1: tokenizer 编码 ===
         enc = self.tokenizer(
@@ -28,50 +41,182 @@ class TokenizerChunker:
             return_offsets_mapping=True,  # 每个 token 在原文中的字符 span
             add_special_tokens=False,
         )
-        input_ids = enc["input_ids"]
-        offsets = enc["offset_mapping"]
 
-        # === Step 2: 滑动窗口切分 token ===
+        # === Step 2: 向量化计算全部窗口 ===
+        bounds = self._window_bounds(enc["offset_mapping"])
+        return self._format_bounds(text, bounds, return_overlap, as_arrays, as_spans)
+
+    def split_texts_with_indices(
+        self,
+        texts: List[str],
+        return_overlap: bool = False,
+        as_arrays: bool = False,
+        as_spans: bool = False,
+    ) -> List[Union[List[Dict[str, Any]], Dict[str, np.ndarray], ChunkSpans]]:
+        """多篇文本一次批量 encode，逐篇返回与 split_text_with_indices 相同的结果"""
+        if not texts:
+            return []
+        enc = self.tokenizer(
+            texts,
+            return_offsets_mapping=True,
+            add_special_tokens=False,
+        )
         results = []
-        start_idx = 0
-        while start_idx < len(input_ids):
-            end_idx = min(start_idx + self.chunk_size, len(input_ids))
-            chunk_ids = input_ids[start_idx:end_idx]
-            chunk_offsets = offsets[start_idx:end_idx]
-
-            # 计算原文位置
-            chunk_start = chunk_offsets[0][0]
-            chunk_end = chunk_offsets[-1][1]
-            chunk_text = text[chunk_start:chunk_end]
+        for text, offsets in zip(texts, enc["offset_mapping"]):
+            bounds = self._window_bounds(offsets)
+            results.append(self._format_bounds(text, bounds, return_overlap, as_arrays, as_spans))
+        return results
 
+    def _format_bounds(
+        self, text: str, bounds: Dict[str, np.ndarray], return_overlap: bool, as_arrays: bool, as_spans: bool
+    ) -> Union[List[Dict[str, Any]], Dict[str, np.ndarray], ChunkSpans]:
+        if as_arrays:
+            return bounds
+        if as_spans:
+            return ChunkSpans(
+                text,
+                bounds["start"],
+                bounds["end"],
+                bounds["main_start"] if return_overlap else None,
+                bounds["main_end"] if return_overlap else None,
+                strip_whitespace=self.strip_whitespace,
+            )
+        return self._bounds_to_dicts(text, bounds, return_overlap)
+
+    def _window_bounds(self, offsets) -> Dict[str, np.ndarray]:
+        """
+        滑动窗口的向量化版本：一次算出所有窗口的 start / end / main_start / main_end（字符位置）。
+        窗口的 token 下标用数组运算得到，再只从 offsets 里取这些下标对应的位置；
+        offsets 保持 tokenizer 返回的 list 即可，整体转成数组反而比窗口计算本身更慢。
+        """
+        n = len(offsets)
+        first = np.arange(0, n, self.chunk_size - self.chunk_overlap)   # 每个窗口首 token
+        last = np.minimum(first + self.chunk_size, n) - 1               # 每个窗口末 token
+        # 主体内容 = 去掉前 overlap 的 token；窗口不足 overlap 个 token 时为空
+        main_token = first + self.chunk_overlap
+        has_main = main_token <= last
+
+        start = np.array([offsets[i][0] for i in first.tolist()], dtype=np.int64)
+        end = np.array([offsets[i][1] for i in last.tolist()], dtype=np.int64)
+        main_start = end.copy()
+        main_idx = np.flatnonzero(has_main)
+        main_start[main_idx] = [offsets[i][0] for i in main_token[main_idx].tolist()]
+        if n:
+            main_start[0] = start[0]
+        return {"start": start, "end": end, "main_start": main_start, "main_end": end.copy()}
+
+    def _bounds_to_dicts(
+        self, text: str, bounds: Dict[str, np.ndarray], return_overlap: bool
+    ) -> List[Dict[str, Any]]:
+        """把 _window_bounds 的数组结果展开为 chunk dict 列表"""
+        results = []
+        rows = zip(bounds["start"].tolist(), bounds["end"].tolist(), bounds["main_start"].tolist())
+        for i, (chunk_start, chunk_end, main_start) in enumerate(rows):
+            chunk_text = text[chunk_start:chunk_end]
             if self.strip_whitespace:
                 chunk_text = chunk_text.strip()
 
             result = {"text": chunk_text, "start": chunk_start, "end": chunk_end}
-
             if return_overlap:
-                if start_idx == 0:
-                    result.update({
-                        "main_text": chunk_text,
-                        "main_start": chunk_start,
-                        "main_end": chunk_end
-                    })
-                else:
-                    # 主体内容 = 去掉前 overlap 的 token
-                    main_start = chunk_offsets[self.chunk_overlap][0] if self.chunk_overlap < len(chunk_offsets) else chunk_end
-                    main_text = text[main_start:chunk_end]
-                    result.update({
-                        "main_text": main_text,
-                        "main_start": main_start,
-                        "main_end": chunk_end
-                    })
-
+                result.update({
+                    "main_text": chunk_text if i == 0 else text[main_start:chunk_end],
+                    "main_start": main_start,
+                    "main_end": chunk_end
+                })
             results.append(result)
+        return results
 
-            # 下一个窗口位置：往后滑动 (chunk_size - overlap)
-            start_idx += self.chunk_size - self.chunk_overlap
+    def split_documents(
+        self,
+        texts: Iterable[str],
+        workers: Optional[int] = None,
+        return_overlap: bool = False,
+        chunksize: int = 1,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """多进程批量切分，tokenizer 在每个 worker 里只加载一次，按输入顺序逐篇产出结果。"""
+        return parallel_map(
+            self, "split_text_with_indices", texts, workers, chunksize,
+            return_overlap=return_overlap,
+        )
 
-        return results
+    def _window_result(
+        self, text: str, chunk_offsets, is_first: bool, return_overlap: bool, base: int = 0
+    ) -> Dict[str, Any]:
+        """由一个 token 窗口的 offsets 生成 chunk dict，base 为 text 在全文中的起始位置"""
+        # 计算原文位置
+        chunk_start = chunk_offsets[0][0]
+        chunk_end = chunk_offsets[-1][1]
+        chunk_text = text[chunk_start:chunk_end]
+
+        if self.strip_whitespace:
+            chunk_text = chunk_text.strip()
+
+        result = {"text": chunk_text, "start": base + chunk_start, "end": base + chunk_end}
+
+        if return_overlap:
+            if is_first:
+                result.update({
+                    "main_text": chunk_text,
+                    "main_start": base + chunk_start,
+                    "main_end": base + chunk_end
+                })
+            else:
+                # 主体内容 = 去掉前 overlap 的 token
+                main_start = chunk_offsets[self.chunk_overlap][0] if self.chunk_overlap < len(chunk_offsets) else chunk_end
+                main_text = text[main_start:chunk_end]
+                result.update({
+                    "main_text": main_text,
+                    "main_start": base + main_start,
+                    "main_end": base + chunk_end
+                })
+        return result
+
+    def iter_chunks(
+        self,
+        stream: TextIO,
+        return_overlap: bool = False,
+        block_size: Optional[int] = None,
+        guard_tokens: int = 16,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式切分：从文件对象逐块读取，窗口一旦确定就产出（start / end 为全文绝对位置）。
+        - 每轮只 encode 缓冲区（上一轮剩下的不足一个窗口的文本 + 新读入的一块）
+        - 缓冲区末尾 guard_tokens 个 token 可能随后续文本改变切法，暂不输出
+        - 输出后丢弃下一个窗口起点之前的文本，内存中只保留约一个窗口 + 一块
+        """
+        block_size = block_size or self.chunk_size * 8
+        step = self.chunk_size - self.chunk_overlap
+        buffer = ""
+        base = 0
+        is_first = True
+        eof = False
+        while not eof:
+            block = stream.read(block_size)
+            eof = block == ""
+            buffer += block
+            if not buffer:
+                break
+
+            offsets = self.tokenizer(
+                buffer,
+                return_offsets_mapping=True,
+                add_special_tokens=False,
+            )["offset_mapping"]
+            limit = len(offsets) if eof else len(offsets) - guard_tokens
+
+            start_idx = 0
+            while start_idx < len(offsets) and (eof or start_idx + self.chunk_size <= limit):
+                end_idx = min(start_idx + self.chunk_size, len(offsets))
+                yield self._window_result(
+                    buffer, offsets[start_idx:end_idx], is_first, return_overlap, base
+                )
+                is_first = False
+                start_idx += step
+
+            if not eof:
+                keep_from = offsets[start_idx][0] if start_idx < len(offsets) else len(buffer)
+                base += keep_from
+                buffer = buffer[keep_from:]
 
 if __name__ == "__main__":
     tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-m3")
@@ -1,12 +1,18 @@
 from typing import (
     Callable,
+    Deque,
     Iterable,
+    Iterator,
     List,
     Optional,
-
+    Tuple,
 )
 from abc import ABC, abstractmethod
+from collections import deque
 import logging
+
+from 分块.token_cache import TokenLengthCache
+
 logger = logging.getLogger(__name__)
 class BaseChunker(ABC):
     @abstractmethod
@@ -24,6 +30,8 @@ class TextSplitter(BaseChunker, ABC):
         keep_separator: bool = False,
         add_start_index: bool = False,
         strip_whitespace: bool = True,
+        batch_length_function: Optional[Callable[[List[str]], List[int]]] = None,
+        length_cache: Optional[TokenLengthCache] = None,
     ) -> None:
         """Create a new TextSplitter.
 
@@ -31,6 +39,10 @@ class TextSplitter(BaseChunker, ABC):
             chunk_size: Maximum size of chunks to return
             chunk_overlap: Overlap in characters between chunks
             length_function: Function that measures the length of given chunks
+            batch_length_function: 可选，一次量一批字符串（如 fast tokenizer 的批量 encode），
+                                   合并前量 splits 时优先使用，结果需与 length_function 一致
+            length_cache: 可选的 TokenLengthCache，用来缓存 length_function /
+                          batch_length_function 的结果（可与 NodeLoader 共用同一个实例）
             keep_separator: Whether to keep the separator in the chunks
             add_start_index: If `True`, includes chunk's start index in metadata
             strip_whitespace: If `True`, strips whitespace from the start and end of
@@ -53,19 +65,24 @@ class TextSplitter(BaseChunker, ABC):
                 f"Got a larger chunk overlap ({chunk_overlap}) than chunk size "
                 f"({chunk_size}), should be smaller."
             )
+        if length_cache is not None:
+            namespace = length_function
+            length_function = length_cache.wrap(length_function, namespace)
+            if batch_length_function is not None:
+                batch_length_function = length_cache.wrap_batch(batch_length_function, namespace)
         self._chunk_size = chunk_size
         self._chunk_overlap = chunk_overlap
         self._length_function = length_function
         self._keep_separator = keep_separator
         self._add_start_index = add_start_index
         self._strip_whitespace = strip_whitespace
+        self._batch_length_function = batch_length_function
 
     @abstractmethod
     def split_text(self, text: str) -> List[str]:
         """Split text into multiple components."""
 
-    def _join_docs(self, docs: List[str], separator: str) -> Optional[str]:
-        text = separator.join(docs)
+    def _clean_doc(self, text: str) -> Optional[str]:
         if self._strip_whitespace:
             text = text.strip()
         if text == "":
@@ -73,18 +90,40 @@ class TextSplitter(BaseChunker, ABC):
         else:
             return text
 
-    def _merge_splits(self, splits: Iterable[str], separator: str) -> List[str]:
-        # We now want to combine these smaller pieces into medium size
-        # chunks to send to the LLM.
-        separator_len = self._length_function(separator)
+    def _join_docs(self, docs: List[str], separator: str) -> Optional[str]:
+        return self._clean_doc(separator.join(docs))
 
-        docs = []
-        current_doc: List[str] = []
+    def _iter_merged_splits(
+        self,
+        splits: Iterable[str],
+        separator: str,
+        lengths: Optional[Iterable[int]] = None,
+        separator_len: Optional[int] = None,
+    ) -> Iterator[Tuple[str, int, int]]:
+        """滑动窗口合并 splits，逐个产出 (拼接后未 strip 的文本, 窗口首个 split 下标, 末个 split 下标)。
+
+        每个 split 只调用一次 length_function，长度缓存在窗口里，
+        overlap 回退用 deque.popleft，整体是线性的。
+        调用方已经量过长度时可以通过 lengths / separator_len 直接传入。
+        """
+        if separator_len is None:
+            separator_len = self._length_function(separator)
+        if lengths is None and self._batch_length_function is not None:
+            splits = list(splits)
+            lengths = self._batch_length_function(splits)
+        if lengths is None:
+            measured = ((d, self._length_function(d)) for d in splits)
+        else:
+            measured = zip(splits, lengths)
+
+        window: Deque[str] = deque()
+        window_lens: Deque[int] = deque()
         total = 0
-        for d in splits:
-            _len = self._length_function(d)
+        first = 0
+        i = -1
+        for i, (d, _len) in enumerate(measured):
             if (
-                total + _len + (separator_len if len(current_doc) > 0 else 0)
+                total + _len + (separator_len if window else 0)
                 > self._chunk_size
             ):
                 if total > self._chunk_size:
@@ -92,78 +131,102 @@ class TextSplitter(BaseChunker, ABC):
                         f"Created a chunk of size {total}, "
                         f"which is longer than the specified {self._chunk_size}"
                     )
-                if len(current_doc) > 0:
-                    doc = self._join_docs(current_doc, separator)
-                    if doc is not None:
-                        docs.append(doc)
+                if window:
+                    yield separator.join(window), first, i - 1
                     # Keep on popping if:
                     # - we have a larger chunk than in the chunk overlap
                     # - or if we still have any chunks and the length is long
                     while total > self._chunk_overlap or (
-                        total + _len + (separator_len if len(current_doc) > 0 else 0)
+                        total + _len + (separator_len if window else 0)
                         > self._chunk_size
                         and total > 0
                     ):
-                        total -= self._length_function(current_doc[0]) + (
-                            separator_len if len(current_doc) > 1 else 0
+                        window.popleft()
+                        total -= window_lens.popleft() + (
+                            separator_len if window else 0
                         )
-                        current_doc = current_doc[1:]
+                        first += 1
 
-            current_doc.append(d)
-            total += _len + (separator_len if len(current_doc) > 1 else 0)
-        doc = self._join_docs(current_doc, separator)
-        if doc is not None:
-            docs.append(doc)
-        return docs
-
-    def _new_merge_splits(self, splits: Iterable[str], separator: str) -> List[dict]:
-        sep_token_len = self._length_function(separator)  # 用 tokenizer 算 separator 长度
+            window.append(d)
+            window_lens.append(_len)
+            total += _len + (separator_len if len(window) > 1 else 0)
+        yield separator.join(window), first, i
 
+    def _merge_splits(
+        self,
+        splits: Iterable[str],
+        separator: str,
+        lengths: Optional[Iterable[int]] = None,
+        separator_len: Optional[int] = None,
+    ) -> List[str]:
+        # We now want to combine these smaller pieces into medium size
+        # chunks to send to the LLM.
         docs = []
-        current_doc: List[str] = []
-
-        token_total = 0  # 当前 chunk 的 token 总数
-        start_idx = 0  # 当前 chunk 在全文的字符起始位置
-
-
-        for d in splits:
-            token_len = self._length_function(d)  # token 粒度
-            # 判断是否需要切分
-            if token_total + token_len + (sep_token_len if len(current_doc) > 0 else 0) > self._chunk_size:
-                if token_total > self._chunk_size:
-                    logger.warning(
-                        f"Created a chunk of size {token_total}, "
-                        f"which is longer than the specified {self._chunk_size}"
-                    )
-                if len(current_doc) > 0:
-                    doc = self._join_docs(current_doc, separator)
-                    if doc is not None:
-                        docs.append({"text": doc, "start_idx": start_idx, "end_idx": start_idx + len(doc)})
-
-                    # 回退 overlap（用 token 粒度控制）
-                    while token_total > self._chunk_overlap or (
-                            token_total + token_len + (sep_token_len if len(current_doc) > 0 else 0) > self._chunk_size
-                            and token_total > 0
-                    ):
-                        removed_tokens = self._length_function(current_doc[0]) + (
-                            sep_token_len if len(current_doc) > 1 else 0)
-                        removed_chars = len(current_doc[0])
-
-                        token_total -= removed_tokens
-                        start_idx += removed_chars
-                        current_doc = current_doc[1:]
-
-            # 添加当前片段
-            current_doc.append(d)
-            token_total += token_len + (sep_token_len if len(current_doc) > 1 else 0)
+        for text, _, _ in self._iter_merged_splits(splits, separator, lengths, separator_len):
+            doc = self._clean_doc(text)
+            if doc is not None:
+                docs.append(doc)
+        return docs
 
-        # 收尾
-        doc = self._join_docs(current_doc, separator)
-        if doc is not None:
-            docs.append({"text": doc, "start_idx": start_idx, "end_idx": start_idx+len(doc) })
+    def _new_merge_splits(
+        self,
+        splits: Iterable[str],
+        separator: str,
+        lengths: Optional[Iterable[int]] = None,
+        separator_len: Optional[int] = None,
+        starts: Optional[List[int]] = None,
+    ) -> List[dict]:
+        """与 _merge_splits 共用滑动窗口，额外记录 chunk 的字符起止位置。
+
+        starts: 每个 split 在原文中的绝对起始位置；不传时按 splits 之间以 separator
+                相连、从 0 开始推算
+        """
+        splits = list(splits)
+        if starts is None:
+            starts, cursor = [], 0
+            for d in splits:
+                starts.append(cursor)
+                cursor += len(d) + len(separator)
 
+        docs = []
+        for text, first, last in self._iter_merged_splits(
+            splits, separator, lengths, separator_len
+        ):
+            doc = self._clean_doc(text)
+            if doc is None:
+                continue
+            start_idx, end_idx = self._doc_span(splits, starts, first, last, separator)
+            docs.append({"text": doc, "start_idx": start_idx, "end_idx": end_idx})
         return docs
 
+    def _doc_span(
+        self, splits: List[str], starts: List[int], first: int, last: int, separator: str
+    ) -> Tuple[int, int]:
+        """splits[first:last+1] 合并成的 chunk 在原文中的区间，strip 掉的首尾空白不计入"""
+        start_idx = starts[first]
+        end_idx = starts[last] + len(splits[last])
+        if not self._strip_whitespace:
+            return start_idx, end_idx
+        # 非空白 separator 会留在 chunk 里，它在原文中紧跟前一个 split
+        keeps_separator = separator.strip() != ""
+        for j in range(first, last + 1):
+            stripped = splits[j].lstrip()
+            if stripped:
+                start_idx = starts[j] + len(splits[j]) - len(stripped)
+                break
+            if keeps_separator and j < last:
+                start_idx = starts[j] + len(splits[j])
+                break
+        for j in range(last, first - 1, -1):
+            stripped = splits[j].rstrip()
+            if stripped:
+                end_idx = starts[j] + len(stripped)
+                break
+            if keeps_separator and j > first:
+                end_idx = starts[j]
+                break
+        return start_idx, end_idx
+
 
 class SimpleSplitter(TextSplitter):
     def split_text(self, text: str):
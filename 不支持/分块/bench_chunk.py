@@ -0,0 +1,136 @@
+"""
+分块性能基准：
+用法（在 不支持/ 目录下）：python -m 分块.bench_chunk [tokenizer 名称或本地路径]
+"""
+import random
+import sys
+import time
+from typing import List
+
+from 分块.base_chunk import TextSplitter
+from 分块.interval_index import IntervalIndex
+from 分块.recursive_chunker import RecursiveTokenChunker
+
+
+class _CharSplitter(TextSplitter):
+    def split_text(self, text: str):
+        return self._new_merge_splits(list(text), "")
+
+
+def _legacy_merge_splits(splitter: TextSplitter, splits: List[str], separator: str) -> List[str]:
+    """旧版合并逻辑（current_doc[1:] + 重复计算长度），仅用于对比"""
+    length_function = splitter._length_function
+    separator_len = length_function(separator)
+    docs = []
+    current_doc: List[str] = []
+    total = 0
+    for d in splits:
+        _len = length_function(d)
+        if total + _len + (separator_len if len(current_doc) > 0 else 0) > splitter._chunk_size:
+            if len(current_doc) > 0:
+                doc = splitter._join_docs(current_doc, separator)
+                if doc is not None:
+                    docs.append(doc)
+                while total > splitter._chunk_overlap or (
+                    total + _len + (separator_len if len(current_doc) > 0 else 0) > splitter._chunk_size
+                    and total > 0
+                ):
+                    total -= length_function(current_doc[0]) + (separator_len if len(current_doc) > 1 else 0)
+                    current_doc = current_doc[1:]
+        current_doc.append(d)
+        total += _len + (separator_len if len(current_doc) > 1 else 0)
+    doc = splitter._join_docs(current_doc, separator)
+    if doc is not None:
+        docs.append(doc)
+    return docs
+
+
+def _make_text(n_chars: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    alphabet = "人工智能正在快速发展尤其是在自然语言处理领域大模型改变交互方式，。\n "
+    return "".join(rng.choice(alphabet) for _ in range(n_chars))
+
+
+def _timeit(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def bench_merge_splits(n_chars: int = 1_000_000, chunk_size: int = 512, chunk_overlap: int = 50):
+    text = _make_text(n_chars)
+    splits = list(text)
+    splitter = _CharSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    legacy, t_legacy = _timeit(_legacy_merge_splits, splitter, splits, "")
+    new, t_new = _timeit(splitter._merge_splits, splits, "")
+    assert legacy == new, "新旧合并结果不一致"
+
+    print(f"[merge_splits] {n_chars} chars, {len(new)} chunks")
+    print(f"  legacy: {t_legacy:.3f}s")
+    print(f"  window: {t_new:.3f}s  ({t_legacy / t_new:.1f}x)")
+
+
+def bench_tokenize_once(n_chars: int = 200_000, model_name: str = "BAAI/bge-m3", n_docs: int = 200):
+    """两种模式并排：整篇文本比耗时，n_docs 篇短文档比切分结果（tokenize-once 的 chunk 边界可能不同）"""
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    text = _make_text(n_chars)
+
+    def token_length(t: str) -> int:
+        # 与 TokenSpanCounter 一样不计 special tokens，差异只来自整篇 / 单独 encode 的切分
+        return len(tokenizer.encode(t, add_special_tokens=False)) if t else 0
+
+    per_split = RecursiveTokenChunker(chunk_size=512, chunk_overlap=50, length_function=token_length)
+    once = RecursiveTokenChunker(chunk_size=512, chunk_overlap=50, tokenizer=tokenizer)
+
+    a, t_split = _timeit(per_split.split_text, text)
+    b, t_once = _timeit(once.split_text, text)
+    print(f"[tokenize_once] {n_chars} chars, {len(a)} / {len(b)} chunks")
+    print(f"  encode per split: {t_split:.3f}s")
+    print(f"  tokenize once:    {t_once:.3f}s  ({t_split / t_once:.1f}x)")
+
+    rng = random.Random(1)
+    docs = [_make_text(rng.randint(500, 5000), seed=k) for k in range(n_docs)]
+    differ = sum(per_split.split_text(d) != once.split_text(d) for d in docs)
+    print(f"  {n_docs} docs: {differ} 篇的 chunk 与 encode per split 不同 ({differ / n_docs:.1%})")
+
+
+def _legacy_overlapping(node_ranges, start_pos: int, end_pos: int) -> List[int]:
+    """旧版 split_json_as_whole 的 node 扫描（每个 chunk 从头扫），仅用于对比"""
+    hits = []
+    for k, (start, end) in enumerate(node_ranges):
+        if end <= start_pos:
+            continue
+        if start >= end_pos:
+            break
+        hits.append(k)
+    return hits
+
+
+def bench_node_attribution(n_nodes: int = 100_000, chunk_chars: int = 2000, overlap_chars: int = 200):
+    rng = random.Random(0)
+    node_ranges, cursor = [], 0
+    for _ in range(n_nodes):
+        size = rng.randint(1, 40)
+        node_ranges.append((cursor, cursor + size))
+        cursor += size
+    chunks = [(s, min(s + chunk_chars, cursor)) for s in range(0, cursor, chunk_chars - overlap_chars)]
+
+    legacy, t_legacy = _timeit(lambda: [_legacy_overlapping(node_ranges, s, e) for s, e in chunks])
+    index = IntervalIndex(node_ranges)
+    new, t_new = _timeit(lambda: [list(index.overlapping(s, e)) for s, e in chunks])
+    assert legacy == new, "新旧 node 归属结果不一致"
+
+    print(f"[node_attribution] {n_nodes} nodes, {len(chunks)} chunks")
+    print(f"  linear scan: {t_legacy:.3f}s")
+    print(f"  bisect:      {t_new:.3f}s  ({t_legacy / t_new:.0f}x)")
+
+
+if __name__ == "__main__":
+    bench_merge_splits()
+    bench_node_attribution()
+    try:
+        bench_tokenize_once(model_name=sys.argv[1] if len(sys.argv) > 1 else "BAAI/bge-m3")
+    except (ImportError, OSError) as e:
+        print(f"[tokenize_once] 跳过：{e.__class__.__name__}")
@@ -0,0 +1,84 @@
+"""
+紧凑的 chunk 集合：
+- 所有 chunk 共享同一份原文，不再为每个 chunk（以及 overlap 的 main_text）复制字符串
+- start / end / main_start / main_end 存在 array('q') 列里，每个 chunk 只占几十字节
+- 访问时才切出文本；下标 / 迭代仍返回与原来相同的 dict，兼容现有调用方
+"""
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+
+class ChunkSpans(Sequence):
+
+    def __init__(
+        self,
+        source: str,
+        starts: Iterable[int],
+        ends: Iterable[int],
+        main_starts: Optional[Iterable[int]] = None,
+        main_ends: Optional[Iterable[int]] = None,
+        strip_whitespace: bool = True,
+        start_key: str = "start",
+        end_key: str = "end",
+    ):
+        """
+        Args:
+            source: 原文，所有 chunk 共享
+            main_starts / main_ends: 去掉 overlap 后的主体区间，不传时 dict 中不含 main_* 字段
+            strip_whitespace: 取 text 时是否 strip（与分块器的设置保持一致）
+            start_key / end_key: dict 中起止位置的字段名（TokenizerChunker 为 start / end）
+        """
+        self.source = source
+        self.starts = array("q", (int(x) for x in starts))
+        self.ends = array("q", (int(x) for x in ends))
+        self.main_starts = array("q", (int(x) for x in main_starts)) if main_starts is not None else None
+        self.main_ends = array("q", (int(x) for x in main_ends)) if main_ends is not None else None
+        self.strip_whitespace = strip_whitespace
+        self.start_key = start_key
+        self.end_key = end_key
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def text(self, i: int) -> str:
+        chunk_text = self.source[self.starts[i]:self.ends[i]]
+        return chunk_text.strip() if self.strip_whitespace else chunk_text
+
+    def main_text(self, i: int) -> str:
+        """主体文本；第一个 chunk 没有 overlap，与 text 相同"""
+        if self.main_starts is None:
+            raise ValueError("ChunkSpans 未记录 main_start / main_end")
+        if i == 0:
+            return self.text(0)
+        return self.source[self.main_starts[i]:self.main_ends[i]]
+
+    def _to_dict(self, i: int) -> Dict[str, Any]:
+        result = {"text": self.text(i), self.start_key: self.starts[i], self.end_key: self.ends[i]}
+        if self.main_starts is not None:
+            result.update({
+                "main_text": self.main_text(i),
+                "main_start": self.main_starts[i],
+                "main_end": self.main_ends[i],
+            })
+        return result
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        if isinstance(i, slice):
+            return [self._to_dict(k) for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("ChunkSpans index out of range")
+        return self._to_dict(i)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self._to_dict(i)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    def nbytes(self) -> int:
+        """各列占用的字节数（不含共享的原文）"""
+        columns = [self.starts, self.ends, self.main_starts, self.main_ends]
+        return sum(c.itemsize * len(c) for c in columns if c is not None)
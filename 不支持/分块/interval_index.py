@@ -0,0 +1,22 @@
+from bisect import bisect_left, bisect_right
+from typing import List, Sequence, Tuple
+
+
+class IntervalIndex:
+    """
+    有序、互不重叠的区间 [start, end) 的索引（如拼接全文中各 node 的字符范围）。
+    查询与 [start, end) 相交的区间：两次二分，O(log n + k)。
+    """
+
+    def __init__(self, ranges: Sequence[Tuple[int, int]]):
+        self.starts: List[int] = [s for s, _ in ranges]
+        self.ends: List[int] = [e for _, e in ranges]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def overlapping(self, start: int, end: int) -> range:
+        """与 [start, end) 相交的区间下标"""
+        first = bisect_right(self.ends, start)   # 第一个 end > start 的区间
+        stop = bisect_left(self.starts, end)     # 第一个 start >= end 的区间
+        return range(first, max(first, stop))
@@ -0,0 +1,86 @@
+"""
+本地 mock LLM 服务（OpenAI 兼容的 /v1/chat/completions），用来测 build_tree 的墙钟时间：
+- 每个请求延迟 latency 秒后返回用户消息的前若干字，模拟真实 LLM 的往返耗时；
+  jitter > 0 时延迟在 [latency, latency * (1 + jitter)] 内随机，模拟个别慢请求
+- 多线程处理请求，并发请求之间不会互相排队
+
+用法（在 不支持/ 目录下）：python -m 分块.mock_llm_server [叶子数] [延迟秒数] [jitter]
+会启动 mock 服务，分别用 concurrency=1、concurrency=16 和 concurrency=16 + pipeline 构建同一棵树并对比耗时。
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+def _make_handler(latency: float, jitter: float = 0.0):
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            content = body.get("messages", [{}])[-1].get("content", "")
+            time.sleep(latency * (1 + jitter * random.random()))
+            data = json.dumps({
+                "id": "mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "总结：" + content[-50:]},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_mock_server(
+    latency: float = 0.2, port: int = 0, jitter: float = 0.0
+) -> Tuple[ThreadingHTTPServer, str]:
+    """在后台线程启动 mock 服务，返回 (server, base_url)；用完调用 server.shutdown()"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(latency, jitter))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    import sys
+    from openai import OpenAI
+    from 分块 import tree
+
+    n_leaves = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    jitter = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    server, base_url = start_mock_server(latency, jitter=jitter)
+    tree.client = OpenAI(api_key="mock", base_url=base_url, max_retries=0)
+
+    def leaves():
+        return [tree.IndexNode(id=f"leaf-{i}", text=f"第 {i} 段正文。", orignal_doc="mock") for i in range(n_leaves)]
+
+    results = {}
+    for concurrency, pipeline in ((1, False), (16, False), (16, True)):
+        start = time.perf_counter()
+        root, nodes_dict = tree.build_tree(
+            leaves(), chunk_size=8, overlap=0, concurrency=concurrency, pipeline=pipeline
+        )
+        elapsed = time.perf_counter() - start
+        results[concurrency, pipeline] = elapsed
+        print(f"concurrency={concurrency:<3d} pipeline={pipeline!s:<5} 节点 {len(nodes_dict)}  耗时 {elapsed:.2f}s")
+    print(f"加速 {results[1, False] / results[16, False]:.1f}x，"
+          f"流水线再加速 {results[16, False] / results[16, True]:.2f}x（每次请求延迟 {latency}s，jitter {jitter}）")
+    server.shutdown()
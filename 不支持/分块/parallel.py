@@ -0,0 +1,53 @@
+"""
+多进程批量处理：
+- 每个 worker 进程只在启动时接收一次 owner（分块器 / loader，连同其中的 tokenizer）
+- 任务只传输入数据本身，结果按输入顺序流式返回
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Iterator, Optional
+
+_worker_fn = None
+_worker_kwargs: dict = {}
+
+
+def _init_worker(owner: Any, method_name: str, kwargs: dict) -> None:
+    global _worker_fn, _worker_kwargs
+    # fork 出来的进程里再开 tokenizers 的线程池容易死锁
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    _worker_fn = getattr(owner, method_name)
+    _worker_kwargs = kwargs
+
+
+def _run(item: Any) -> Any:
+    return _worker_fn(item, **_worker_kwargs)
+
+
+def parallel_map(
+    owner: Any,
+    method_name: str,
+    items: Iterable[Any],
+    workers: Optional[int] = None,
+    chunksize: int = 1,
+    **kwargs: Any,
+) -> Iterator[Any]:
+    """
+    在进程池里对每个 item 调用 owner.<method_name>(item, **kwargs)，按输入顺序产出结果。
+
+    Args:
+        owner: 需要可 pickle；每个 worker 只反序列化一次
+        workers: 进程数，默认 os.cpu_count()；为 1 时直接在当前进程执行
+        chunksize: 每次派发给 worker 的 item 数，文档很多且很短时调大可减少通信
+    """
+    if workers == 1:
+        fn = getattr(owner, method_name)
+        for item in items:
+            yield fn(item, **kwargs)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(owner, method_name, kwargs),
+    ) as pool:
+        yield from pool.map(_run, items, chunksize=chunksize)
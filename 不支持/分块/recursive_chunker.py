@@ -1,8 +1,10 @@
 # from 分块.base_chunk import TextSplitter
 
 import re
-from typing import Optional, Union, Literal, Any, List
-from base_chunk import TextSplitter
+from bisect import bisect_left
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, TextIO, Union, Literal, Any, List
+from 分块.base_chunk import TextSplitter
+from 分块.parallel import parallel_map
 def _split_text_with_regex(
     text: str, separator: str, *, keep_separator: Union[bool, Literal["start", "end"]]
 ) -> list[str]:
@@ -29,6 +31,68 @@ def _split_text_with_regex(
         splits = list(text)
     return [s for s in splits if s != ""]
 
+def _split_spans_with_pattern(
+    text: str,
+    offset: int,
+    pattern: re.Pattern,
+    *,
+    keep_separator: Union[bool, Literal["start", "end"]],
+) -> list[tuple[int, str]]:
+    """与 _split_text_with_regex 切法一致，pattern 是预编译的 separator，
+    返回 (片段在整篇文档中的起始位置, 片段)。
+    按 finditer 的 match.start() / end() 定位切点，separator 自带捕获组时也不会错位"""
+    spans = []
+    prev = 0
+    for m in pattern.finditer(text):
+        if keep_separator == "end":
+            end, next_start = m.end(), m.end()
+        elif keep_separator:
+            end, next_start = m.start(), m.start()
+        else:
+            end, next_start = m.start(), m.end()
+        if end > prev:
+            spans.append((offset + prev, text[prev:end]))
+        prev = next_start
+    if prev < len(text):
+        spans.append((offset + prev, text[prev:]))
+    return spans
+
+
+class _SplitContext(NamedTuple):
+    """一次 split 调用内跨递归层共享的长度函数"""
+    measure_many: Callable[[list[tuple[int, str]]], list[int]]
+    separator_length: Callable[[str], int]
+
+
+class TokenSpanCounter:
+    """
+    tokenize-once：整篇文档只 encode 一次（带 offset_mapping），
+    任意字符区间 [start, end) 的 token 数 = 起点落在区间内的 token 个数，
+    在有序的 token 起点数组上二分取前缀计数，不再对片段重复 encode。
+    这是整篇切分下的计数，与单独 encode 片段不同：切点附近的 token 合并、
+    片段开头的 "▁" 等都会让两者差几个 token，所以 chunk 边界可能与默认模式不同。
+    """
+
+    def __init__(self, tokenizer, text: str, offset: int = 0):
+        """offset: text 在整篇文档中的起始位置，count 接受的是文档上的绝对位置"""
+        self.tokenizer = tokenizer
+        enc = tokenizer(
+            text,
+            return_offsets_mapping=True,
+            add_special_tokens=False,
+        )
+        self.token_starts = sorted(offset + s for s, _ in enc["offset_mapping"])
+
+    def count(self, start: int, end: int) -> int:
+        return bisect_left(self.token_starts, end) - bisect_left(self.token_starts, start)
+
+    def count_text(self, text: str) -> int:
+        """不在文档里的独立字符串（如 separator）单独 encode"""
+        if not text:
+            return 0
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
 class RecursiveTokenChunker(TextSplitter):
     """Splitting text by recursively look at characters."""
     def __init__(
@@ -36,54 +100,111 @@ class RecursiveTokenChunker(TextSplitter):
         separators: Optional[list[str]] = None,
         keep_separator: Union[bool, Literal["start", "end"]] = True,  # noqa: FBT001,FBT002
         is_separator_regex: bool = False,  # noqa: FBT001,FBT002
+        tokenizer: Any = None,
         **kwargs: Any,
     ) -> None:
-        """Create a new TextSplitter."""
+        """Create a new TextSplitter.
+
+        Args:
+            tokenizer: 传入 HuggingFace fast tokenizer 时启用 tokenize-once 模式，
+                       整篇文档只 encode 一次，片段长度由 TokenSpanCounter 查表得到
+                       （不含 special tokens），此时不再调用 length_function 量片段。
+                       计数与单独 encode 片段不完全相同，chunk 边界可能与默认模式不同
+                       （差异比例见 bench_chunk 的 tokenize_once 一项），需要时显式开启；
+                       未传 tokenizer 但配置了 batch_length_function 时，每层的 splits 一次批量量完
+        """
         super().__init__(keep_separator=keep_separator, **kwargs)
         self._separators = separators or ["\n\n", "\n", "。", ""]
         self._is_separator_regex = is_separator_regex
+        self._tokenizer = tokenizer
+        # separator 只在构造时编译一次，检测和切分共用
+        self._separator_patterns: dict[str, re.Pattern] = {}
+        for _s in self._separators:
+            if _s and _s not in self._separator_patterns:
+                self._separator_patterns[_s] = re.compile(_s if is_separator_regex else re.escape(_s))
 
+    def _make_context(self, text: str, offset: int = 0) -> _SplitContext:
+        """为整篇文档准备长度函数。
 
+        measure_many 一次量一层的全部 splits，参数是 (piece 在文档中的绝对位置, piece)，
+        tokenize-once 模式靠位置查表，配置了 batch_length_function 时整批交给它。
+        """
+        if self._tokenizer is not None:
+            counter = TokenSpanCounter(self._tokenizer, text, offset)
+            return _SplitContext(
+                lambda splits: [counter.count(start, start + len(s)) for start, s in splits],
+                counter.count_text,
+            )
+        if self._batch_length_function is not None:
+            return _SplitContext(
+                lambda splits: self._batch_length_function([s for _, s in splits]),
+                self._length_function,
+            )
+        return _SplitContext(
+            lambda splits: [self._length_function(s) for _, s in splits],
+            self._length_function,
+        )
 
-    def _split_text(self, text: str, separators: list[str]) -> list[str]:
-        """Split incoming text and return chunks."""
-        final_chunks = []
-        # Get appropriate separator to use
+    def _choose_splits(
+        self, text: str, separators: list[str], offset: int
+    ) -> tuple[str, list[str], list[tuple[int, str]]]:
+        """选出 text 中第一个出现的 separator 并切分，返回 (separator, 剩余 separators, 带绝对位置的 splits)"""
         separator = separators[-1]
         new_separators = []
         for i, _s in enumerate(separators):
-            _separator = _s if self._is_separator_regex else re.escape(_s)
             if _s == "":
                 separator = _s
                 break
-            if re.search(_separator, text):
+            if self._separator_patterns[_s].search(text):
                 separator = _s
                 new_separators = separators[i + 1 :]
                 break
 
-        _separator = separator if self._is_separator_regex else re.escape(separator)
-        splits = _split_text_with_regex(
-            text, _separator, keep_separator=self._keep_separator
+        if separator == "":
+            return separator, new_separators, [(offset + i, c) for i, c in enumerate(text)]
+        splits = _split_spans_with_pattern(
+            text, offset, self._separator_patterns[separator], keep_separator=self._keep_separator
         )
+        return separator, new_separators, splits
+
+    def _split_text(
+        self,
+        text: str,
+        separators: list[str],
+        offset: int = 0,
+        ctx: Optional[_SplitContext] = None,
+    ) -> list[str]:
+        """Split incoming text and return chunks."""
+        if ctx is None:
+            ctx = self._make_context(text, offset)
+        final_chunks = []
+        # Get appropriate separator to use
+        separator, new_separators, splits = self._choose_splits(text, separators, offset)
 
         # Now go merging things, recursively splitting longer texts.
-        _good_splits = []
+        _good_splits, _good_lens = [], []
         _separator = "" if self._keep_separator else separator
-        for s in splits:
-            if self._length_function(s) < self._chunk_size:
+        _separator_len = ctx.separator_length(_separator)
+        for (start, s), s_len in zip(splits, ctx.measure_many(splits)):
+            if s_len < self._chunk_size:
                 _good_splits.append(s)
+                _good_lens.append(s_len)
             else:
                 if _good_splits:
-                    merged_text = self._merge_splits(_good_splits, _separator)
+                    merged_text = self._merge_splits(
+                        _good_splits, _separator, _good_lens, _separator_len
+                    )
                     final_chunks.extend(merged_text)
-                    _good_splits = []
+                    _good_splits, _good_lens = [], []
                 if not new_separators:
                     final_chunks.append(s)
                 else:
-                    other_info = self._split_text(s, new_separators)
+                    other_info = self._split_text(s, new_separators, start, ctx)
                     final_chunks.extend(other_info)
         if _good_splits:
-            merged_text = self._merge_splits(_good_splits, _separator)
+            merged_text = self._merge_splits(
+                _good_splits, _separator, _good_lens, _separator_len
+            )
             final_chunks.extend(merged_text)
         return final_chunks
 
@@ -100,52 +221,119 @@ class RecursiveTokenChunker(TextSplitter):
         return self._split_text(text, self._separators)
 
 
-    def _split_text_with_index(self, text: str, separators: list[str]) -> list[dict]:
-        """Split incoming text and return chunks with start/end indices."""
-        final_chunks = []
-        separator = separators[-1]
-        new_separators = []
-        for i, _s in enumerate(separators):
-            _separator = _s if self._is_separator_regex else re.escape(_s)
-            if _s == "":
-                separator = _s
-                break
-            if re.search(_separator, text):
-                separator = _s
-                new_separators = separators[i + 1 :]
-                break
+    def _split_text_with_index(
+        self,
+        text: str,
+        separators: list[str],
+        offset: int = 0,
+        ctx: Optional[_SplitContext] = None,
+    ) -> list[dict]:
+        """Split incoming text and return chunks with start/end indices.
 
-        _separator = separator if self._is_separator_regex else re.escape(separator)
-        splits = _split_text_with_regex(
-            text, _separator, keep_separator=self._keep_separator
-        )
+        offset 是 text 在整篇文档中的起始位置，递归时逐层传递，
+        返回的 start_idx / end_idx 都是相对整篇文档的绝对位置。
+        """
+        if ctx is None:
+            ctx = self._make_context(text, offset)
+        final_chunks = []
+        separator, new_separators, splits = self._choose_splits(text, separators, offset)
 
-        _good_splits = []
+        _good_splits, _good_lens, _good_starts = [], [], []
         _separator = "" if self._keep_separator else separator
-        for s in splits:
-            if self._length_function(s) < self._chunk_size:
+        _separator_len = ctx.separator_length(_separator)
+        for (start, s), s_len in zip(splits, ctx.measure_many(splits)):
+            if s_len < self._chunk_size:
                 _good_splits.append(s)
+                _good_lens.append(s_len)
+                _good_starts.append(start)
             else:
                 if _good_splits:
-                    merged_texts = self._new_merge_splits(_good_splits, _separator)
+                    merged_texts = self._new_merge_splits(
+                        _good_splits, _separator, _good_lens, _separator_len, _good_starts
+                    )
                     final_chunks.extend(merged_texts)
-                    _good_splits = []
+                    _good_splits, _good_lens, _good_starts = [], [], []
                 if not new_separators:
                     final_chunks.append(
-                        {"text": s, "start_idx": text.find(s), "end_idx": text.find(s) + len(s)}
+                        {"text": s, "start_idx": start, "end_idx": start + len(s)}
                     )
                 else:
-                    other_info = self._split_text_with_index(s, new_separators)
+                    other_info = self._split_text_with_index(s, new_separators, start, ctx)
                     final_chunks.extend(other_info)
         if _good_splits:
-            merged_texts = self._new_merge_splits(_good_splits, _separator)
+            merged_texts = self._new_merge_splits(
+                _good_splits, _separator, _good_lens, _separator_len, _good_starts
+            )
             final_chunks.extend(merged_texts)
         return final_chunks
 
     def split_text_with_index(self, text: str) -> list[dict]:
-        """Public API: split text into chunks with start/end indices."""
+        """Public API: split text into chunks with start/end indices.
+
+        text[start_idx:end_idx] 与 chunk 文本对应（keep_separator=False 且
+        separator 为正则时，区间覆盖的是原文中被拼接的那一段）。
+        """
         return self._split_text_with_index(text, self._separators)
 
+    def split_documents(
+        self, texts: Iterable[str], workers: Optional[int] = None, chunksize: int = 1
+    ) -> Iterator[list[dict]]:
+        """多进程批量切分，按输入顺序逐篇产出 split_text_with_index 的结果。
+
+        每个 worker 只反序列化一次本分块器（包括 tokenizer / length_function 背后的 tokenizer），
+        因此 length_function 需要可 pickle（bound method、模块级函数均可，lambda 不行）。
+        """
+        return parallel_map(self, "split_text_with_index", texts, workers, chunksize)
+
+    def iter_chunks(
+        self, stream: TextIO, block_size: Optional[int] = None
+    ) -> Iterator[dict]:
+        """流式切分：从文件对象逐块读取，chunk 一旦确定就产出（start_idx / end_idx 为全文绝对位置）。
+
+        缓冲区攒到 2 * block_size 个字符后，在后半段里找优先级最高的 separator 作为切点，
+        切点之前的部分按 split_text_with_index 切分并输出，之后的部分留到下一轮。
+        内存中只保留约 2 * block_size 个字符；切点两侧的 chunk 之间没有 overlap。
+
+        Args:
+            stream: 文本文件对象（需支持 read(n)）
+            block_size: 每次读取的字符数，默认 4 * chunk_size
+        """
+        block_size = block_size or self._chunk_size * 4
+        buffer = ""
+        base = 0
+        eof = False
+        while not eof:
+            block = stream.read(block_size)
+            eof = block == ""
+            buffer += block
+            if not eof and len(buffer) < 2 * block_size:
+                continue
+            cut = len(buffer) if eof else self._stream_cut(buffer)
+            if cut > 0:
+                yield from self._split_text_with_index(buffer[:cut], self._separators, base)
+                base += cut
+                buffer = buffer[cut:]
+
+    def _stream_cut(self, buffer: str) -> int:
+        """在 buffer 后半段找优先级最高的 separator，返回切点；都没有时整段切出"""
+        lower = len(buffer) // 2
+        for _s in self._separators:
+            if _s == "":
+                break
+            last = None
+            for last in self._separator_patterns[_s].finditer(buffer, lower):
+                pass
+            if last is None:
+                continue
+            # 与切分时一致：keep_separator 为 True/"start" 时 separator 归下一段
+            if self._keep_separator and self._keep_separator != "end":
+                cut = last.start()
+            else:
+                cut = last.end()
+            if cut > 0:
+                return cut
+        return len(buffer)
+
 
 
 if __name__ == "__main__":
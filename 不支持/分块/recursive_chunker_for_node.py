@@ -1,7 +1,9 @@
 from typing import List, Dict, Any, Optional, Union
 from pydantic import BaseModel
-from spliter.src.recursive_chunker import RecursiveTokenChunker
-from Node.base_node import  NodeLoader
+from 分块.recursive_chunker import RecursiveTokenChunker
+from 节点.base_node import NodeLoader
+from 分块.interval_index import IntervalIndex
+from 节点.node_io import save_nodes
 from transformers import AutoTokenizer
 #
 import uuid
@@ -66,7 +68,13 @@ class IndexNode(BaseModel):
 
 import uuid
 import json
-from typing import List
+from bisect import bisect_right
+from difflib import SequenceMatcher
+from typing import List, Tuple
+
+# 稳定 chunk ID 的命名空间：同一文档、同一内容（及其出现序号）总是得到同一个 ID
+_CHUNK_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "rag/index-node/chunk")
+
 
 class JsonDocChunker(RecursiveTokenChunker):
     def __init__(self, **kwargs):
@@ -84,9 +92,8 @@ class JsonDocChunker(RecursiveTokenChunker):
             return "\n".join(parts)
         return ""
 
-    def split_json_as_whole(
-        self, nodes: List[Node], save_path: str = None
-    ) -> List[IndexNode]:
+    def _concat_nodes(self, nodes: List[Node]) -> Tuple[str, list]:
+        """拼接全文，并记录每个非空 node 在全文中的范围 (start, end, node)"""
         texts = []
         node_ranges = []
         cursor = 0
@@ -101,31 +108,48 @@ class JsonDocChunker(RecursiveTokenChunker):
             end = cursor + len(t)
             node_ranges.append((start, end, node))
             cursor = end # 保证下一个 node 起始不重叠
-            print(start,end)
 
-        full_text = "".join(texts)
-        print(len(full_text))
-        chunks =  self.split_text_with_indices(full_text, return_overlap=False)
+        return "".join(texts), node_ranges
+
+    @staticmethod
+    def _doc_key(nodes: List[Node], doc_id: Optional[str]) -> str:
+        if doc_id is not None:
+            return doc_id
+        return next((n.orignal_doc for n in nodes if n.orignal_doc), "")
+
+    @staticmethod
+    def stable_chunk_ids(texts: List[str], doc_key: str = "") -> List[str]:
+        """
+        由内容生成确定性的 chunk ID：uuid5(文档, 同文本第几次出现, 文本)。
+        内容不变的 chunk 在重新切分后 ID 不变，下游 embedding / Milvus 行可以复用。
+        """
+        seen: Dict[str, int] = {}
+        ids = []
+        for t in texts:
+            occurrence = seen.get(t, 0)
+            seen[t] = occurrence + 1
+            ids.append(str(uuid.uuid5(_CHUNK_ID_NAMESPACE, f"{doc_key}\x00{occurrence}\x00{t}")))
+        return ids
 
+    def _build_index_nodes(
+        self, chunks: List[dict], node_ranges: list, ids: Optional[List[str]] = None
+    ) -> List[IndexNode]:
+        """chunks 带 full_text 上的绝对 start_idx / end_idx；ids 为空时用 uuid4"""
         results: List[IndexNode] = []
+        # node 区间按起点有序且互不重叠，二分定位与 chunk 相交的 node
+        node_index = IntervalIndex([(start, end) for start, end, _ in node_ranges])
 
         for i, c in enumerate(chunks):
 
-            start_pos = c.get("start")
-            end_pos = c.get("end")
+            start_pos = c.get("start_idx")
+            end_pos = c.get("end_idx")
             # end_pos = start_pos + len(c)
             # chunk_cursor = end_pos  # 推进到下一个 chunk 的起始位置
             # print(start_pos,end_pos)
             related_ids, related_images, related_tables, related_pages = [], [], [], []
 
-            for start, end, node in node_ranges:
-                # print(start,end,start_pos,end_pos)
-                if end <= start_pos:# node 在 chunk 左边
-                    # print("continue")
-                    continue
-                if start >= end_pos:
-                    # print("break")# node 在 chunk 右边，后面都不会相交
-                    break
+            for k in node_index.overlapping(start_pos, end_pos):
+                node = node_ranges[k][2]
 
                 # 有交集
                 related_ids.append(str(node.id))
@@ -164,7 +188,7 @@ class JsonDocChunker(RecursiveTokenChunker):
 
             # ✅ 构建 IndexNode
             new_node = IndexNode(
-                id=str(uuid.uuid4()),
+                id=ids[i] if ids is not None else str(uuid.uuid4()),
                 summary=None,
                 text=c.get("text"),
                 children=related_ids or None,
@@ -172,19 +196,161 @@ class JsonDocChunker(RecursiveTokenChunker):
                 meta=meta
             )
             results.append(new_node)
+        return results
 
-        # ✅ 如果提供了 save_path，则保存到本地 JSON 文件
+    @staticmethod
+    def _save_results(results: List[IndexNode], save_path: Optional[str]) -> None:
+        # ✅ 如果提供了 save_path，则保存到本地文件（.jsonl 每行一个节点，其余为 JSON）
         if save_path:
-            with open(save_path, "w", encoding="utf-8") as f:
-                json.dump(
-                    [node.model_dump() for node in results],
-                    f,
-                    ensure_ascii=False,
-                    indent=2
-                )
+            save_nodes(results, save_path, "jsonl" if str(save_path).endswith(".jsonl") else "json")
+
+    def split_json_as_whole(
+        self,
+        nodes: List[Node],
+        save_path: str = None,
+        stable_ids: bool = False,
+        doc_id: Optional[str] = None,
+    ) -> List[IndexNode]:
+        """
+        Args:
+            stable_ids: True 时 chunk ID 由内容生成（见 stable_chunk_ids），否则为 uuid4。
+                之后要用 rechunk_incremental 做增量更新的话应打开
+            doc_id: 参与稳定 ID 计算的文档标识，默认取 node 的 orignal_doc
+        """
+        full_text, node_ranges = self._concat_nodes(nodes)
+        # start_idx / end_idx 是 full_text 上的绝对位置，可直接和 node_ranges 比较
+        chunks = self.split_text_with_index(full_text)
 
+        ids = None
+        if stable_ids:
+            ids = self.stable_chunk_ids([c.get("text") for c in chunks], self._doc_key(nodes, doc_id))
+        results = self._build_index_nodes(chunks, node_ranges, ids)
+        self._save_results(results, save_path)
         return results
 
+    @staticmethod
+    def _locate_chunks(full_text: str, chunks: List[IndexNode]) -> Optional[List[dict]]:
+        """
+        按顺序在全文中找回旧 chunk 的位置：chunk 起点递增，且不晚于上一个 chunk 的终点
+        （跳过空白后），文本重复时取这一范围内最靠后的出现位置，使找回的区间首尾相接。
+        有 chunk 找不到（如 keep_separator=False 拼接过的文本）时返回 None。
+        """
+        spans = []
+        lo, hi = 0, 0
+        for c in chunks:
+            text = c.text or ""
+            if not text:
+                return None
+            while hi < len(full_text) and full_text[hi].isspace():
+                hi += 1
+            pos = full_text.rfind(text, lo, hi + len(text))
+            if pos < 0:
+                pos = full_text.find(text, lo)
+            if pos < 0:
+                return None
+            spans.append({"text": text, "start_idx": pos, "end_idx": pos + len(text)})
+            lo, hi = pos + 1, pos + len(text)
+        return spans
+
+    def _reuse_unchanged(
+        self, old_text: str, old_ranges: list, new_text: str, new_ranges: list, old_spans: List[dict]
+    ) -> List[dict]:
+        """保留完全落在未变化 node 段内的旧 chunk（平移到新位置），只重切它们之间的空档"""
+        matcher = SequenceMatcher(
+            None,
+            [old_text[s:e] for s, e, _ in old_ranges],
+            [new_text[s:e] for s, e, _ in new_ranges],
+            autojunk=False,
+        )
+        # 未变化的连续 node 段：(旧全文起点, 旧全文终点, 平移量)
+        blocks = [
+            (old_ranges[i1][0], old_ranges[i2 - 1][1], new_ranges[j1][0] - old_ranges[i1][0])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+            if tag == "equal"
+        ]
+        block_starts = [start for start, _, _ in blocks]
+
+        chunks: List[dict] = []
+        cursor = 0
+        prev = None  # 上一个保留 chunk 的 (旧序号, 所在段)
+        for k, c in enumerate(old_spans):
+            b = bisect_right(block_starts, c["start_idx"]) - 1
+            if b < 0 or c["end_idx"] > blocks[b][1]:
+                continue
+            shift = blocks[b][2]
+            start, end = c["start_idx"] + shift, c["end_idx"] + shift
+            # 与上一个保留 chunk 不相邻（中间有 chunk 被丢弃或跨了段）时，重切两者之间的文本
+            if (prev is None or prev != (k - 1, b)) and start > cursor:
+                chunks.extend(self._split_text_with_index(new_text[cursor:start], self._separators, cursor))
+            chunks.append({"text": c["text"], "start_idx": start, "end_idx": end})
+            cursor = max(cursor, end)
+            prev = (k, b)
+
+        tail_unchanged = (
+            prev is not None
+            and prev[0] == len(old_spans) - 1
+            and new_text[cursor:] == old_text[old_spans[-1]["end_idx"]:]
+        )
+        if not tail_unchanged and cursor < len(new_text):
+            chunks.extend(self._split_text_with_index(new_text[cursor:], self._separators, cursor))
+        return chunks
+
+    @staticmethod
+    def _attribution(node: IndexNode) -> tuple:
+        """chunk 的归属信息（来源 node 和 meta），ID 只由文本决定，这部分需要单独比较"""
+        meta = node.meta.model_dump() if node.meta is not None else None
+        return node.children, meta
+
+    def rechunk_incremental(
+        self,
+        old_nodes: List[Node],
+        new_nodes: List[Node],
+        old_results: List[IndexNode],
+        save_path: str = None,
+        doc_id: Optional[str] = None,
+    ) -> Tuple[List[IndexNode], Dict[str, List[str]]]:
+        """
+        文档局部修改后的增量切分：
+        1. 用 SequenceMatcher 比较新旧 node 文本，得到未变化的连续 node 段
+        2. 完全落在未变化段内的旧 chunk 原样保留，只平移位置
+        3. 只对保留 chunk 之间的空档（即变化区域附近）重新切分
+        4. 所有 chunk 按新 node 列表重新计算 children / meta，ID 由内容生成
+
+        old_results 应来自 split_json_as_whole(stable_ids=True) 或上一次 rechunk_incremental。
+        变化区域两侧的接缝处不再有 overlap；旧 chunk 无法在旧全文中定位时退化为整篇重切。
+
+        Returns:
+            (results, diff)，diff 含 reused / metadata_changed / added / removed 四个 ID 列表：
+            reused 的 chunk 无需重新 embedding / 入库；metadata_changed 的文本未变（ID 不变），
+            但 children / meta（如 page_idx）变了，embedding 可复用，标量字段需要重新写入；
+            removed 的应从向量库删除
+        """
+        old_text, old_ranges = self._concat_nodes(old_nodes)
+        new_text, new_ranges = self._concat_nodes(new_nodes)
+        old_spans = self._locate_chunks(old_text, old_results)
+
+        if old_spans is None:
+            chunks = self.split_text_with_index(new_text)
+        else:
+            chunks = self._reuse_unchanged(old_text, old_ranges, new_text, new_ranges, old_spans)
+
+        texts = [c.get("text") for c in chunks]
+        ids = self.stable_chunk_ids(texts, self._doc_key(new_nodes, doc_id))
+        results = self._build_index_nodes(chunks, new_ranges, ids)
+        self._save_results(results, save_path)
+
+        old_by_id = {n.id: n for n in old_results}
+        new_ids = set(ids)
+        kept = [n for n in results if n.id in old_by_id]
+        changed = [n.id for n in kept if self._attribution(n) != self._attribution(old_by_id[n.id])]
+        changed_ids = set(changed)
+        diff = {
+            "reused": [n.id for n in kept if n.id not in changed_ids],
+            "metadata_changed": changed,
+            "added": [i for i in ids if i not in old_by_id],
+            "removed": [n.id for n in old_results if n.id not in new_ids],
+        }
+        return results, diff
 
 
 if __name__=="__main__":
@@ -0,0 +1,100 @@
+"""
+LLM 总结的持久化缓存：
+- key 为 sha256(模型, prompt 模板, 合并后的子节点文本)，内容相同就复用，与节点 id 无关
+- 存在 sqlite 文件里（标准库），每次写入即提交，构建中途崩溃也不会丢已完成的总结
+- 按总字节数限制大小，超出时按最近使用时间淘汰到上限的 90%
+- hits / misses 计数，构建结束时打印
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class SummaryCache:
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        if max_bytes <= 0:
+            raise ValueError(f"max_bytes must be > 0, got {max_bytes}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON summaries(last_used)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, prompt_template: str, text: str) -> str:
+        payload = json.dumps([model, prompt_template, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        size = len(key) + len(value.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM summaries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target_bytes: int) -> None:
+        """按 last_used 从旧到新删除，直到总大小不超过 target_bytes"""
+        removed, freed = [], 0
+        for key, size in self._conn.execute("SELECT key, size FROM summaries ORDER BY last_used"):
+            if self._total_bytes - freed <= target_bytes:
+                break
+            removed.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM summaries WHERE key = ?", removed)
+        self._total_bytes -= freed
+        self.evictions += len(removed)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries")
+            self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,146 @@
+"""
+token 长度缓存：
+- 同一段文本在 loader / 分块器 / merge / compute_token 中会被反复计算 token 数
+- 以 (命名空间, 文本长度, 文本 hash) 为 key 的有界 LRU，不保存文本本身
+- 命名空间区分 tokenizer 和计数方式（是否带 special tokens 等）
+- hits / misses 计数，用来确认在真实语料上是否划算
+- wrap / wrap_batch 返回可 pickle 的包装对象，split_documents 在 spawn 方式下也能把分块器传给子进程；
+  pickle 时缓存内容不随之复制（hash(text) 在不同进程间不一致），子进程从空缓存开始
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class _CachedLength:
+    """TokenLengthCache.wrap 的返回值"""
+    __slots__ = ("cache", "length_function", "namespace")
+
+    def __init__(self, cache: "TokenLengthCache", length_function: Callable[[str], int], namespace: Hashable):
+        self.cache = cache
+        self.length_function = length_function
+        self.namespace = namespace
+
+    def __call__(self, text: str) -> int:
+        if not text:
+            return self.length_function(text)
+        key = (self.namespace, len(text), hash(text))
+        value = self.cache._get(key)
+        if value is None:
+            value = self.length_function(text)
+            self.cache._put(key, value)
+        return value
+
+    def __getstate__(self) -> tuple:
+        return self.cache, self.length_function, self.namespace
+
+    def __setstate__(self, state: tuple) -> None:
+        self.cache, self.length_function, self.namespace = state
+
+
+class _CachedBatchLength:
+    """TokenLengthCache.wrap_batch 的返回值"""
+    __slots__ = ("cache", "batch_length_function", "namespace")
+
+    def __init__(
+        self,
+        cache: "TokenLengthCache",
+        batch_length_function: Callable[[List[str]], List[int]],
+        namespace: Hashable,
+    ):
+        self.cache = cache
+        self.batch_length_function = batch_length_function
+        self.namespace = namespace
+
+    def __call__(self, texts: List[str]) -> List[int]:
+        results: List[Optional[int]] = [None] * len(texts)
+        missing: List[int] = []
+        for i, text in enumerate(texts):
+            if not text:
+                missing.append(i)
+                continue
+            results[i] = self.cache._get((self.namespace, len(text), hash(text)))
+            if results[i] is None:
+                missing.append(i)
+        if missing:
+            values = self.batch_length_function([texts[i] for i in missing])
+            for i, value in zip(missing, values):
+                results[i] = value
+                if texts[i]:
+                    self.cache._put((self.namespace, len(texts[i]), hash(texts[i])), value)
+        return results
+
+    def __getstate__(self) -> tuple:
+        return self.cache, self.batch_length_function, self.namespace
+
+    def __setstate__(self, state: tuple) -> None:
+        self.cache, self.batch_length_function, self.namespace = state
+
+
+class TokenLengthCache:
+
+    def __init__(self, maxsize: int = 100_000):
+        if maxsize <= 0:
+            raise ValueError(f"maxsize must be > 0, got {maxsize}")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[tuple, int]" = OrderedDict()
+
+    @staticmethod
+    def tokenizer_namespace(tokenizer: Any, kind: str = "encode") -> Hashable:
+        """同名 tokenizer 的不同实例共享缓存；没有名字时退化为对象 id"""
+        name = getattr(tokenizer, "name_or_path", None) or id(tokenizer)
+        return type(tokenizer).__name__, name, kind
+
+    def _get(self, key: tuple) -> Optional[int]:
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _put(self, key: tuple, value: int) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def wrap(
+        self, length_function: Callable[[str], int], namespace: Optional[Hashable] = None
+    ) -> Callable[[str], int]:
+        """包装单条长度函数；namespace 默认就是函数本身"""
+        namespace = length_function if namespace is None else namespace
+        return _CachedLength(self, length_function, namespace)
+
+    def wrap_batch(
+        self,
+        batch_length_function: Callable[[List[str]], List[int]],
+        namespace: Optional[Hashable] = None,
+    ) -> Callable[[List[str]], List[int]]:
+        """包装批量长度函数：只把未命中的文本交给原函数，命名空间需与单条版本一致才能共享"""
+        namespace = batch_length_function if namespace is None else namespace
+        return _CachedBatchLength(self, batch_length_function, namespace)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """只保留 maxsize，缓存内容和计数不跨进程"""
+        return {"maxsize": self.maxsize}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["maxsize"])
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
@@ -1,10 +1,20 @@
+import heapq
+import json
+import logging
 import re
 import uuid
-import json
-from typing import List, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from pydantic import BaseModel
 from openai import OpenAI
 from 节点.base_node import NodeLoader
+from 节点.node_io import save_tree, load_tree
+from 节点.node_store import NodeStore
+from 节点.tree_index import TreeIndex, write_tree_index
+from 分块.summary_cache import SummaryCache
+from 分块.tree_checkpoint import TreeCheckpoint
+
+logger = logging.getLogger(__name__)
 
 
 # ========== 数据结构定义 ==========
@@ -61,15 +71,20 @@ class IndexNode(BaseModel):
     parent: Optional[str] = None
     orignal_doc: Optional[str] = None
     meta: Optional[MetaNode] = None
+    enter: Optional[int] = None   # 先序编号
+    exit: Optional[int] = None    # 子树（沿 children 可达的节点）中最大的先序编号
 
 
 # ========== LLM summarizer ==========
 
 client = OpenAI(api_key="your_api_key", base_url="http://10.60.200.100:11454/v1")
 
-def summarize_with_llm(text: str, model="Qwen/Qwen3-32B-AWQ") -> str:
+SUMMARY_MODEL = "Qwen/Qwen3-32B-AWQ"
+SUMMARY_PROMPT = "请帮我总结以下内容，生成简洁的一段总结：\n\n{text}"
+
+def summarize_with_llm(text: str, model=SUMMARY_MODEL) -> str:
     """调用大模型生成总结"""
-    prompt = f"请帮我总结以下内容，生成简洁的一段总结：\n\n{text}"
+    prompt = SUMMARY_PROMPT.format(text=text)
     response = client.chat.completions.create(
         model=model,
         messages=[{"role": "user", "content": prompt}],
@@ -80,6 +95,85 @@ def summarize_with_llm(text: str, model="Qwen/Qwen3-32B-AWQ") -> str:
     return resp
 
 
+def _call_llm(
+    texts: List[str], concurrency: int, on_done: Optional[Callable[[int, str], None]] = None
+) -> List[str]:
+    """
+    逐个或并发请求总结，结果顺序与 texts 一致；on_done(下标, 总结) 在每个请求完成时于调用线程中触发。
+    某个请求失败时取消尚未开始的请求，已在进行的请求仍会完成并触发 on_done，之后抛出第一个异常。
+    """
+    if concurrency <= 1 or len(texts) <= 1:
+        results = []
+        for i, text in enumerate(texts):
+            results.append(summarize_with_llm(text))
+            if on_done is not None:
+                on_done(i, results[i])
+        return results
+
+    results: List[Optional[str]] = [None] * len(texts)
+    error = None
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(texts))) as pool:
+        futures = {pool.submit(summarize_with_llm, text): i for i, text in enumerate(texts)}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                if error is None:
+                    error = e
+                    for f in futures:
+                        f.cancel()
+                continue
+            if on_done is not None:
+                on_done(i, results[i])
+    if error is not None:
+        raise error
+    return results
+
+
+def summarize_many(
+    texts: List[str],
+    concurrency: int = 8,
+    cache: Optional[SummaryCache] = None,
+    on_done: Optional[Callable[[int, str], None]] = None,
+) -> List[str]:
+    """
+    并发调用 summarize_with_llm（线程池，最多 concurrency 个请求同时进行），结果顺序与 texts 一致。
+    传入 cache 时先查缓存，只有未命中的文本才请求 LLM（同一批内重复的文本只请求一次），结果写回缓存。
+    on_done(下标, 总结) 在每条结果就绪时触发（缓存命中的立即触发），用于逐组写检查点。
+    """
+    if cache is None:
+        return _call_llm(texts, concurrency, on_done)
+
+    results: List[Optional[str]] = [None] * len(texts)
+    pending: dict[str, List[int]] = {}   # 未命中的文本 -> 在 texts 中的下标
+    for i, text in enumerate(texts):
+        if text in pending:
+            pending[text].append(i)
+            continue
+        cached = cache.get(cache.make_key(SUMMARY_MODEL, SUMMARY_PROMPT, text))
+        if cached is not None:
+            results[i] = cached
+            if on_done is not None:
+                on_done(i, cached)
+        else:
+            pending[text] = [i]
+
+    todo = list(pending)
+
+    def finished(k: int, summary: str) -> None:
+        cache.put(cache.make_key(SUMMARY_MODEL, SUMMARY_PROMPT, todo[k]), summary)
+        for i in pending[todo[k]]:
+            results[i] = summary
+            if on_done is not None:
+                on_done(i, summary)
+
+    _call_llm(todo, concurrency, finished)
+    return results
+
+
 # ========== 滑动窗口分组 ==========
 
 def sliding_window_merge(nodes: List[IndexNode], chunk_size: int, overlap: int) -> List[List[IndexNode]]:
@@ -93,19 +187,107 @@ def sliding_window_merge(nodes: List[IndexNode], chunk_size: int, overlap: int)
     return merged_groups
 
 
+def token_budget_merge(
+    nodes: List[IndexNode],
+    max_tokens: int,
+    length_function: Callable[[str], int],
+    overlap_tokens: int = 0,
+    separator_tokens: int = 1,
+) -> List[List[IndexNode]]:
+    """
+    按 token 数分组：依次装入节点直到再加一个就超过 max_tokens，
+    下一组以上一组末尾不超过 overlap_tokens 的若干节点开头。
+    - length_function 是总结模型所用 tokenizer 的长度函数（如 loader._huggingface_tokenizer_length），
+      必须传入：IndexNode 没有 token_count 字段，叶子和总结节点都靠它计数；
+      节点带 token_count 时（如 MineruNode）直接用，不再计算
+    - separator_tokens 是 build_one_level 拼接文本时每个空格分隔符计入的长度
+    - 每组至少两个节点（剩最后一个时除外），保证每层节点数递减、build_tree 能收敛；
+      单个节点本身超过预算、或强制凑够两个节点后超过预算时仍会整组送出，不做截断，只记一条 warning
+    - 返回结构与 sliding_window_merge 相同，可作为 build_tree 的 group_fn
+    """
+    if max_tokens <= 0:
+        raise ValueError(f"max_tokens must be > 0, got {max_tokens}")
+    lengths = [
+        getattr(n, "token_count", None) or length_function(n.text or "")
+        for n in nodes
+    ]
+    groups = []
+    i = 0
+    while i < len(nodes):
+        j, total = i, 0
+        while j < len(nodes):
+            cost = lengths[j] + (separator_tokens if j > i else 0)
+            if j - i >= 2 and total + cost > max_tokens:
+                break
+            total += cost
+            j += 1
+        if total > max_tokens:
+            logger.warning(
+                f"Created a group of size {total}, "
+                f"which is longer than the specified {max_tokens}"
+            )
+        groups.append(nodes[i:j])
+        if j >= len(nodes):
+            break
+        # 回退到 overlap 的起点，至少前进一个节点
+        k, back = j, 0
+        while k - 1 > i and back + lengths[k - 1] <= overlap_tokens:
+            k -= 1
+            back += lengths[k]
+        i = k
+    return groups
+
+
 # ========== 构建一层树 ==========
 
-def build_one_level(nodes: List[IndexNode], chunk_size: int, overlap: int) -> List[IndexNode]:
-    """构建树的一层：合并节点并生成总结节点"""
-    groups = sliding_window_merge(nodes, chunk_size, overlap)
+def build_one_level(
+    nodes: List[IndexNode],
+    chunk_size: int,
+    overlap: int,
+    store: Optional[NodeStore] = None,
+    concurrency: int = 8,
+    cache: Optional[SummaryCache] = None,
+    group_fn: Optional[Callable[[List[IndexNode]], List[List[IndexNode]]]] = None,
+    checkpoint: Optional[TreeCheckpoint] = None,
+    level: int = 1,
+) -> List[IndexNode]:
+    """
+    构建树的一层：合并节点并生成总结节点；传入 store 时总结节点写入 store，返回视图。
+    同一层各组的总结并发请求（concurrency 为 1 时逐个请求），节点仍按分组顺序创建；
+    cache 命中的组不再请求 LLM。
+    group_fn 为空时按 chunk_size / overlap 个数分组，否则用它分组（如 token_budget_merge）。
+    checkpoint: 每完成一组就记录下来；检查点里已有的组（第 level 层）直接复用，连同节点 id
+    """
+    if group_fn is None:
+        groups = sliding_window_merge(nodes, chunk_size, overlap)
+    else:
+        groups = group_fn(nodes)
     new_nodes = []
 
-    for group in groups:
-        combined_text = " ".join([n.text or "" for n in group])
-        text = summarize_with_llm(combined_text)
-
-        new_id = str(uuid.uuid4())
-        new_node = IndexNode(
+    # 节点 id 先按分组顺序生成，完成一组即可写检查点
+    ids = [str(uuid.uuid4()) for _ in groups]
+    children = [[n.id for n in group] for group in groups]
+    summaries: List[Optional[str]] = [None] * len(groups)
+    todo = []
+    for g in range(len(groups)):
+        record = checkpoint.get(level, g, children[g]) if checkpoint is not None else None
+        if record is not None:
+            ids[g], summaries[g] = record["id"], record["text"]
+        else:
+            todo.append(g)
+
+    def group_done(k: int, summary: str) -> None:
+        g = todo[k]
+        summaries[g] = summary
+        if checkpoint is not None:
+            checkpoint.record(level, g, ids[g], summary, children[g], groups[g][0].orignal_doc)
+
+    combined_texts = [" ".join([n.text or "" for n in groups[g]]) for g in todo]
+    summarize_many(combined_texts, concurrency, cache, group_done)
+
+    for group, new_id, text in zip(groups, ids, summaries):
+
+        fields = dict(
             id=new_id,
             node_type=1,
             summary=None,
@@ -114,6 +296,7 @@ def build_one_level(nodes: List[IndexNode], chunk_size: int, overlap: int) -> Li
             parent=None,
             orignal_doc=group[0].orignal_doc
         )
+        new_node = store.append(fields) if store is not None else IndexNode(**fields)
 
         # 更新子节点 parent
         for n in group:
@@ -126,26 +309,443 @@ def build_one_level(nodes: List[IndexNode], chunk_size: int, overlap: int) -> Li
 
 # ========== 递归构建总结树 ==========
 
-def build_tree(nodes: List[IndexNode], chunk_size: int, overlap: int) -> tuple[IndexNode, dict]:
+def build_tree(
+    nodes: List[IndexNode],
+    chunk_size: int,
+    overlap: int,
+    concurrency: int = 8,
+    cache: Optional[SummaryCache] = None,
+    group_fn: Optional[Callable[[List[IndexNode]], List[List[IndexNode]]]] = None,
+    checkpoint: Optional[TreeCheckpoint] = None,
+    pipeline: bool = False,
+) -> tuple[IndexNode, dict]:
     """
     递归构建总结树，返回 (root, nodes_dict)
     nodes_dict 包含所有节点（叶子+中间层+根节点）
+    concurrency: 每层同时进行的 LLM 请求数上限
+    cache: 总结缓存，内容未变的组直接复用；构建结束时用 logger.info 记录本次的命中情况
+    group_fn: 自定义分组，例如按 token 预算：
+        partial(token_budget_merge, max_tokens=6000, overlap_tokens=200,
+                length_function=loader._huggingface_tokenizer_length)
+    checkpoint: 断点续建，见 TreeCheckpoint；中断后用同一个检查点文件重新调用即可从缺失的组继续
+    nodes 为 NodeStore 时总结节点直接追加进同一个 store，nodes_dict 是按 id 访问视图的只读映射
+    pipeline: 按数据流调度，上一层某组的子节点都总结完就开始总结它，不等整层完成，
+        见 _build_levels_pipelined；分组、父子关系与逐层构建相同
+    构建完成后每个节点都带有先序区间 enter / exit，见 assign_euler_intervals
     """
-    level_nodes = nodes
-    nodes_dict: dict[str, IndexNode] = {n.id: n for n in nodes}  # 先存叶子
+    store = nodes if isinstance(nodes, NodeStore) else None
+    level_nodes = list(nodes)
+    if store is not None:
+        nodes_dict = store.id_mapping()
+    else:
+        nodes_dict: dict[str, IndexNode] = {n.id: n for n in nodes}  # 先存叶子
     root = None
-
+    if cache is not None:
+        hits_before, misses_before = cache.hits, cache.misses
+    if checkpoint is not None:
+        checkpoint.begin(level_nodes)
+
+    if pipeline:
+        try:
+            levels = _build_levels_pipelined(
+                level_nodes, chunk_size, overlap, store, concurrency, cache, group_fn, checkpoint
+            )
+        except Exception:
+            if checkpoint is not None:
+                checkpoint.close()
+            raise
+        if store is None:
+            for new_nodes in levels[1:]:
+                for n in new_nodes:
+                    nodes_dict[n.id] = n
+        level_nodes = levels[-1]
+
+    level = 0
     while len(level_nodes) > 1:
-        new_nodes = build_one_level(level_nodes, chunk_size, overlap)
+        level += 1
+        try:
+            new_nodes = build_one_level(
+                level_nodes, chunk_size, overlap, store, concurrency, cache, group_fn, checkpoint, level
+            )
+        except Exception:
+            if checkpoint is not None:
+                checkpoint.close()
+            raise
 
         # 存储中间层节点
-        for n in new_nodes:
-            nodes_dict[n.id] = n
+        if store is None:
+            for n in new_nodes:
+                nodes_dict[n.id] = n
 
         root = new_nodes[0] if len(new_nodes) == 1 else None
         level_nodes = new_nodes
 
-    return (root or level_nodes[0]), nodes_dict
+    if checkpoint is not None:
+        checkpoint.close()
+        logger.info(f"检查点: 复用 {checkpoint.reused} 组，新完成 {checkpoint.recorded} 组")
+    if cache is not None:
+        hits, misses = cache.hits - hits_before, cache.misses - misses_before
+        rate = hits / (hits + misses) if hits + misses else 0.0
+        logger.info(f"总结缓存: 命中 {hits}，未命中 {misses}，命中率 {rate:.1%}，缓存条目 {len(cache)}")
+
+    root = root or level_nodes[0]
+    assign_euler_intervals(root, nodes_dict)
+    return root, nodes_dict
+
+
+# ========== 流水线构建 ==========
+
+def _stable_groups(
+    items: List[Any], complete: bool, group_fn: Callable[[List[Any]], List[List[Any]]],
+    index_of: Callable[[Any], int],
+) -> Tuple[List[List[int]], Optional[int]]:
+    """
+    对一层节点中已可用的一段 items 分组，返回 (不会再变的组（下标列表）, 下次分组的起点)。
+    complete 为 False 时，含 items 最后一个元素的组及其后的组都可能随后续节点到来而变化，
+    丢弃它们，下次从第一个被丢弃的组的起点重新分组；complete 为 True 时全部保留，起点为 None
+    """
+    stable = []
+    for group in group_fn(items):
+        idx = [index_of(x) for x in group]
+        if not complete and idx[-1] >= index_of(items[-1]):
+            return stable, idx[0]
+        stable.append(idx)
+    return stable, None
+
+
+def _build_levels_pipelined(
+    leaves: List[IndexNode],
+    chunk_size: int,
+    overlap: int,
+    store: Optional[NodeStore] = None,
+    concurrency: int = 8,
+    cache: Optional[SummaryCache] = None,
+    group_fn: Optional[Callable[[List[IndexNode]], List[List[IndexNode]]]] = None,
+    checkpoint: Optional[TreeCheckpoint] = None,
+) -> List[List[IndexNode]]:
+    """
+    数据流方式构建各层，返回 [叶子, 第 1 层, ..., [根]]，父节点在全部完成后按层、按组的顺序写入，
+    与 build_one_level 逐层构建的结果一致（overlap 共享的子节点归属右边的组）。
+    - 一组的子节点都已存在就开始总结，不等同层其他组；LLM 请求全局最多 concurrency 个同时进行，
+      就绪的组优先调度层数高的（离根近、在关键路径上），同层按组的顺序
+    - 分组与逐层构建相同：sliding_window_merge 只依赖节点个数，节点占位确定即可分组；
+      group_fn 按已完成的最长前缀分组，只采纳不含前缀末尾节点的组，
+      要求 group_fn 从左到右贪心分组（如 token_budget_merge）：追加节点不改变前面已结束的组，
+      从某组的起点重新分组得到的后续各组也不变
+    - cache / checkpoint 的用法与 build_one_level 相同，同时在等待的相同文本只请求一次
+    - 某个请求失败时不再开始新的组，已在进行的请求完成并写入检查点后抛出第一个异常
+    """
+    def by_window(items: List[Any]) -> List[List[Any]]:
+        return sliding_window_merge(items, chunk_size, overlap)
+
+    limit = max(1, concurrency)
+
+    levels: List[List[Optional[IndexNode]]] = [list(leaves)]   # levels[k][i]，未完成为 None
+    sizes: Dict[int, int] = {0: len(leaves)}        # 分组已全部确定的层的节点数
+    groups: Dict[int, List[List[int]]] = {}         # groups[k][g]: 第 k 层第 g 组在第 k-1 层中的下标
+    missing: Dict[Tuple[int, int], int] = {}        # 尚未完成的子节点数
+    consumers: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}   # 节点 -> 以它为子节点的组
+    resume = {0: 0}       # 第 k 层下次分组的起点
+    prefix = {0: 0}       # 第 k 层从头连续已完成的节点数
+    seen: Dict[int, Tuple[int, bool]] = {}          # 第 k 层上次分组时的 (可用节点数, 是否完整)
+    ready: List[Tuple[int, int]] = []               # 堆：(-层, 组)
+    running: Dict[Any, str] = {}                    # future -> 文本
+    waiting: Dict[str, List[Tuple[int, int]]] = {}  # 文本 -> 等待这个总结的组
+    error = None
+
+    def advance(k: int) -> None:
+        """第 k 层有新节点完成或新占位，确定能确定的第 k+1 层分组"""
+        if sizes.get(k) == 1 or k + 1 in sizes:
+            return  # 根所在的层，或者分组已全部确定
+        nodes = levels[k]
+        while prefix[k] < len(nodes) and nodes[prefix[k]] is not None:
+            prefix[k] += 1
+        if group_fn is None:
+            end = len(nodes)
+            items, index_of = list(range(resume[k], end)), (lambda i: i)
+        else:
+            end = prefix[k]
+            items = nodes[resume[k]:end]
+            rows = {n.id: resume[k] + i for i, n in enumerate(items)}
+            index_of = lambda n: rows[n.id]
+        complete = sizes.get(k) == end
+        if not items or seen.get(k) == (end, complete):
+            return
+        seen[k] = (end, complete)
+        stable, start = _stable_groups(items, complete, group_fn or by_window, index_of)
+        level_groups = groups.setdefault(k + 1, [])
+        if len(levels) == k + 1:
+            levels.append([])
+            prefix[k + 1], resume[k + 1] = 0, 0
+        levels_above = levels[k + 1]
+        for idx in stable:
+            g = len(level_groups)
+            level_groups.append(idx)
+            levels_above.append(None)
+            missing[(k + 1, g)] = sum(nodes[i] is None for i in idx)
+            for i in idx:
+                consumers.setdefault((k, i), []).append((k + 1, g))
+            if missing[(k + 1, g)] == 0:
+                heapq.heappush(ready, (-(k + 1), g))
+        if complete:
+            sizes[k + 1] = len(level_groups)
+        else:
+            resume[k] = start
+        if stable:
+            advance(k + 1)   # 上一层多了占位（按个数分组时即可继续分组）或刚确定了节点数
+
+    def finish(level: int, g: int, node_id: str, text: str, record: bool) -> None:
+        children = [levels[level - 1][i] for i in groups[level][g]]
+        child_ids = [n.id for n in children]
+        if record and checkpoint is not None:
+            checkpoint.record(level, g, node_id, text, child_ids, children[0].orignal_doc)
+        fields = dict(
+            id=node_id,
+            node_type=1,
+            summary=None,
+            text=text,
+            children=child_ids,
+            parent=None,
+            orignal_doc=children[0].orignal_doc
+        )
+        levels[level][g] = IndexNode(**fields)   # 有 store 时在结束后按层、组的顺序写入
+        for consumer in consumers.pop((level, g), []):
+            missing[consumer] -= 1
+            if missing[consumer] == 0:
+                heapq.heappush(ready, (-consumer[0], consumer[1]))
+        advance(level)
+
+    def start(level: int, g: int) -> None:
+        children = [levels[level - 1][i] for i in groups[level][g]]
+        record = checkpoint.get(level, g, [n.id for n in children]) if checkpoint is not None else None
+        if record is not None:
+            finish(level, g, record["id"], record["text"], record=False)
+            return
+        text = " ".join([n.text or "" for n in children])
+        if text in waiting:
+            waiting[text].append((level, g))
+            return
+        cached = cache.get(cache.make_key(SUMMARY_MODEL, SUMMARY_PROMPT, text)) if cache is not None else None
+        if cached is not None:
+            finish(level, g, str(uuid.uuid4()), cached, record=True)
+            return
+        waiting[text] = [(level, g)]
+        running[pool.submit(summarize_with_llm, text)] = text
+
+    with ThreadPoolExecutor(max_workers=limit) as pool:
+        advance(0)
+        while True:
+            while ready and error is None and len(running) < limit:
+                neg_level, g = heapq.heappop(ready)
+                start(-neg_level, g)
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                text = running.pop(future)
+                if future.cancelled():
+                    continue
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+                        for f in running:
+                            f.cancel()
+                    continue
+                if cache is not None:
+                    cache.put(cache.make_key(SUMMARY_MODEL, SUMMARY_PROMPT, text), summary)
+                for level, g in waiting.pop(text):
+                    finish(level, g, str(uuid.uuid4()), summary, record=True)
+    if error is not None:
+        raise error
+
+    # 总结节点按完成顺序产生，store 的行按 (层, 组) 的顺序追加，与逐层构建一致
+    if store is not None:
+        for level in range(1, len(levels)):
+            levels[level] = [store.append(n) for n in levels[level]]
+    # 与逐层构建一样按组的顺序写父节点，共享的子节点最终归属右边的组
+    for level in range(1, len(levels)):
+        for g, idx in enumerate(groups[level]):
+            for i in idx:
+                levels[level - 1][i].parent = levels[level][g].id
+    return levels
+
+
+# ========== 先序区间 ==========
+
+def tree_children(node: IndexNode, nodes_dict: dict) -> List[IndexNode]:
+    """
+    node 在树中的子节点；叶子（node_type == 0）返回空列表。
+    JsonDocChunker / final.json 的叶子 children 存的是 MinerU 源节点 id，不在 nodes_dict 里，
+    所以只取 nodes_dict 中存在的 children
+    """
+    if node.node_type == 0 or not node.children:
+        return []
+    return [nodes_dict[c] for c in node.children if c in nodes_dict]
+
+
+def assign_euler_intervals(root: IndexNode, nodes_dict: dict) -> None:
+    """
+    给每个节点写入先序区间 [enter, exit]，X 下的全部叶子即 node_type == 0 且 X.enter <= enter <= X.exit。
+    先序遍历沿 parent 指针确定的树进行；overlap > 0 时共享的子节点归属右边的组，
+    它们的编号紧跟在左边组的子树之后，exit 取所有 children（含共享的）的最大值，
+    所以范围内的叶子仍然恰好是沿 children 可达的叶子（范围里会夹带右侧相邻的总结节点，按叶子过滤即可）。
+    """
+    order = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        node.enter = len(order)
+        order.append(node)
+        own = [c for c in tree_children(node, nodes_dict) if c.parent == node.id]
+        stack.extend(reversed(own))
+    # 子节点的编号都大于父节点，按编号从大到小即可自底向上求 exit
+    for node in reversed(order):
+        node.exit = max([node.enter] + [c.exit for c in tree_children(node, nodes_dict)])
+
+
+def merge_intervals(intervals: List[tuple]) -> List[tuple]:
+    """合并重叠或相邻的区间，多个父节点的扇出通常会合并成少数几个区间"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def vector_rows(nodes_dict: dict, book_id: Optional[str] = None) -> List[dict]:
+    """
+    写入向量库的标量字段（embedding 另行填充）；enter / exit 需建成 INT64 字段，
+    按子树过滤时用 subtree_filter 生成的表达式
+    """
+    return [
+        {
+            "id": n.id,
+            "text": n.text,
+            "node_type": n.node_type,
+            "parent_id": n.parent,
+            "book_id": book_id or n.orignal_doc,
+            "enter": n.enter,
+            "exit": n.exit,
+        }
+        for n in nodes_dict.values()
+    ]
+
+
+def subtree_filter(book_id: str, intervals: List[tuple], leaves_only: bool = True) -> str:
+    """多个子树的过滤表达式（Milvus filter 语法），每个区间一个范围条件"""
+    ranges = " or ".join(f"(enter >= {a} and enter <= {b})" for a, b in merge_intervals(intervals))
+    expr = f"book_id == {json.dumps(book_id, ensure_ascii=False)}"
+    if leaves_only:
+        expr += " and node_type == 0"
+    return f"{expr} and ({ranges})" if ranges else expr
+
+
+# ========== 增量更新 ==========
+
+def tree_leaves(root: IndexNode, nodes_dict: dict) -> List[IndexNode]:
+    """按从左到右的顺序取出树的叶子（overlap 导致重复出现的只保留第一次）"""
+    leaves, seen, stack = [], set(), [root]
+    while stack:
+        node = stack.pop()
+        children = tree_children(node, nodes_dict)
+        if not children:
+            if node.id not in seen:
+                seen.add(node.id)
+                leaves.append(node)
+            continue
+        stack.extend(reversed(children))
+    return leaves
+
+
+def update_tree(
+    root: IndexNode,
+    nodes_dict: dict,
+    chunk_size: int,
+    overlap: int,
+    added: Optional[List[IndexNode]] = None,
+    removed: Optional[List[str]] = None,
+    changed: Optional[List[IndexNode]] = None,
+    concurrency: int = 8,
+    cache: Optional[SummaryCache] = None,
+    group_fn: Optional[Callable[[List[IndexNode]], List[List[IndexNode]]]] = None,
+) -> tuple[IndexNode, dict]:
+    """
+    在已有的树上增量更新叶子，返回新的 (root, nodes_dict)，不修改传入的 nodes_dict；
+    传入 build_tree 在 NodeStore 上建的树时，返回的节点是脱离 store 的 IndexNode 副本
+    added: 新叶子，按顺序追加到末尾；removed: 删除的叶子 id；changed: 文本有变化的叶子（按 id 替换）
+    逐层按与 build_tree 相同的方式重新分组：子节点 id 与旧树某个总结节点完全一致、
+    且这些子节点本身没有变化的组直接复用旧节点（id 和总结都不变），其余的组才请求 LLM。
+    追加叶子时只有树的右边缘需要重新总结，每次更新约 O(log n) 次请求；
+    在中间删除或插入叶子会让后面的分组整体移位，后面的组都要重新总结。
+    chunk_size / overlap / group_fn 需与构建时一致，否则几乎无法复用。
+    """
+    removed_ids = set(removed or [])
+    replaced = {n.id: n for n in changed or []}
+    leaves = [
+        replaced.get(n.id, n)
+        for n in tree_leaves(root, nodes_dict)
+        if n.id not in removed_ids
+    ]
+    leaves.extend(added or [])
+    if not leaves:
+        raise ValueError("update_tree: 更新后没有剩余的叶子")
+    missing = set(replaced) - {n.id for n in leaves}
+    if missing:
+        raise KeyError(f"changed 中的叶子不在树中: {sorted(missing)}")
+
+    # 旧树的总结节点按子节点 id 索引
+    by_children = {
+        tuple(n.children): n for n in nodes_dict.values() if n.node_type != 0 and n.children
+    }
+    dirty = set(replaced) | {n.id for n in added or []}   # 本次新建或内容变化的节点
+    new_dict: dict[str, IndexNode] = {n.id: n for n in leaves}
+    level_nodes = leaves
+    reused = 0
+    while len(level_nodes) > 1:
+        if group_fn is None:
+            groups = sliding_window_merge(level_nodes, chunk_size, overlap)
+        else:
+            groups = group_fn(level_nodes)
+
+        new_nodes: List[Optional[IndexNode]] = [None] * len(groups)
+        todo = []
+        for g, group in enumerate(groups):
+            ids = [n.id for n in group]
+            old = by_children.get(tuple(ids))
+            if old is not None and not dirty.intersection(ids):
+                new_nodes[g] = old.model_copy(update={"parent": None})
+                reused += 1
+            else:
+                todo.append(g)
+
+        combined_texts = [" ".join([n.text or "" for n in groups[g]]) for g in todo]
+        summaries = summarize_many(combined_texts, concurrency, cache)
+        for g, text in zip(todo, summaries):
+            new_nodes[g] = IndexNode(
+                id=str(uuid.uuid4()),
+                node_type=1,
+                summary=None,
+                text=text,
+                children=[n.id for n in groups[g]],
+                parent=None,
+                orignal_doc=groups[g][0].orignal_doc
+            )
+            dirty.add(new_nodes[g].id)
+
+        for group, parent in zip(groups, new_nodes):
+            for n in group:
+                new_dict[n.id] = n.model_copy(update={"parent": parent.id})
+            new_dict[parent.id] = parent
+        level_nodes = [new_dict[n.id] for n in new_nodes]
+
+    new_root = new_dict[level_nodes[0].id]
+    assign_euler_intervals(new_root, new_dict)   # 编号会整体移位，复用的节点也要重写
+    logger.info(f"增量更新: 复用 {reused} 个总结节点，重新总结 {len(new_dict) - len(leaves) - reused} 个")
+    return new_root, new_dict
 
 
 # ========== 工具：递归打印树 ==========
@@ -166,27 +766,28 @@ def build_tree(nodes: List[IndexNode], chunk_size: int, overlap: int) -> tuple[I
 # ========== 保存 & 加载 ==========
 
 def save_tree_json(root: IndexNode, nodes_dict: dict, path: str):
-    """保存树为 JSON 文件"""
-    all_nodes = {nid: n.model_dump() for nid, n in nodes_dict.items()}
-    data = {
-        "root_id": root.id,
-        "nodes": all_nodes
-    }
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """
+    保存树；path 以 .jsonl 结尾时每行一个节点，以 .tidx 结尾时写二进制索引（见 节点/tree_index.py），
+    否则为 indent=2 的 JSON 文件
+    """
+    if str(path).endswith(".tidx"):
+        write_tree_index(root.id, nodes_dict, path)
+        print(f"树已保存到 {path}")
+        return
+    save_tree(root.id, nodes_dict, path, "jsonl" if str(path).endswith(".jsonl") else "json")
     print(f"树已保存到 {path}")
 
 
 def load_tree_json(path: str) -> tuple[IndexNode, dict]:
-    """从 JSON 文件加载树，返回 (root_node, nodes_dict)"""
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    nodes_dict: dict[str, IndexNode] = {}
-    for nid, node_data in data["nodes"].items():
-        nodes_dict[nid] = IndexNode(**node_data)
-
-    root_id = data["root_id"]
+    """
+    从 JSON / JSONL 文件加载树，返回 (root_node, nodes_dict)
+    .tidx 文件只做 mmap，nodes_dict 是 TreeIndex（按 id 访问的只读映射），节点文本在访问时才解码；
+    它持有打开的文件，由调用方在用完后 close()
+    """
+    if str(path).endswith(".tidx"):
+        index = TreeIndex(path)
+        return index.root, index
+    root_id, nodes_dict = load_tree(path, IndexNode, "jsonl" if str(path).endswith(".jsonl") else "json")
     root_node = nodes_dict[root_id]
     return root_node, nodes_dict
 
@@ -195,13 +796,14 @@ def load_tree_json(path: str) -> tuple[IndexNode, dict]:
 
 if __name__ == "__main__":
     from transformers import AutoTokenizer
+    logging.basicConfig(level=logging.INFO, format="%(message)s")   # 显示缓存 / 检查点统计
     tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-m3")
 
     loader = NodeLoader(tokenizer, model_cls=IndexNode)
     nodes = loader.load_for_model(r"D:\新建文件夹\rag-master\final.json")
 
     # ✅ 一步拿到 root 和完整 nodes_dict
-    root, nodes_dict = build_tree(nodes, chunk_size=15, overlap=0)
+    root, nodes_dict = build_tree(nodes, chunk_size=15, overlap=0, cache=SummaryCache("summary_cache.sqlite"))
 
     print("==== 树结构 ====")
     # print_tree(root, nodes_dict)
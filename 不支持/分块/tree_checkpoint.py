@@ -0,0 +1,96 @@
+"""
+build_tree 的断点续建：
+- 检查点是一个追加写的 JSONL 文件：第一行记录叶子指纹，之后每完成一组总结追加一行
+  {"level", "index", "id", "text", "children", "orignal_doc"}，写入后立即 fsync
+- 续建时同一层同一组、且子节点 id 完全一致的记录直接复用（连同节点 id），
+  只有缺失的组才请求 LLM；分组方式变了的组因为子节点不同会自然失效
+- 叶子（id 或文本）变了则拒绝续建，避免拼出内容不一致的树
+- 崩溃时最后一行可能只写了一半，加载时跳过
+可以反复运行直到树构建完成；已完成的树再运行一次不会发出任何 LLM 请求。
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class TreeCheckpoint:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reused = 0
+        self.recorded = 0
+        self._leaves_fingerprint: Optional[str] = None
+        self._groups: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._file = None
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 崩溃时写了一半的行
+                if "leaves" in record:
+                    self._leaves_fingerprint = record["leaves"]
+                else:
+                    self._groups[(record["level"], record["index"])] = record
+
+    @staticmethod
+    def fingerprint(leaves: List[Any]) -> str:
+        h = hashlib.sha256()
+        for n in leaves:
+            h.update(json.dumps([n.id, n.text], ensure_ascii=False).encode("utf-8"))
+        return h.hexdigest()
+
+    def begin(self, leaves: List[Any]) -> None:
+        """开始（或继续）构建；叶子与检查点不一致时抛 ValueError"""
+        fingerprint = self.fingerprint(leaves)
+        if self._leaves_fingerprint is not None and self._leaves_fingerprint != fingerprint:
+            raise ValueError(f"叶子节点与检查点 {self.path} 不一致，请删除检查点后重新构建")
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            self._file.write("\n")  # 截断的半行单独成行，不影响后面追加的记录
+        if self._leaves_fingerprint is None:
+            self._write({"leaves": fingerprint})
+            self._leaves_fingerprint = fingerprint
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def get(self, level: int, index: int, children: List[str]) -> Optional[Dict[str, Any]]:
+        """已完成的组；子节点对不上时视为没有"""
+        record = self._groups.get((level, index))
+        if record is None or record["children"] != children:
+            return None
+        self.reused += 1
+        return record
+
+    def record(self, level: int, index: int, node_id: str, text: str,
+               children: List[str], orignal_doc: Optional[str]) -> None:
+        record = {
+            "level": level,
+            "index": index,
+            "id": node_id,
+            "text": text,
+            "children": children,
+            "orignal_doc": orignal_doc,
+        }
+        self._groups[(level, index)] = record
+        self._write(record)
+        self.recorded += 1
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self._file.write("\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
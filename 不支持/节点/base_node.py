@@ -1,10 +1,14 @@
 import json
-from typing import List, Optional, Dict, Any, Union, Type
+from typing import List, Optional, Dict, Any, Union, Type, Iterable, Iterator, Tuple
 from pathlib import Path
 
 from pydantic import BaseModel, TypeAdapter
 from transformers import AutoTokenizer
 from 分块.recursive_chunker import RecursiveTokenChunker
+from 分块.token_cache import TokenLengthCache
+from 节点.json_stream import iter_json_array
+from 节点.node_io import gc_paused, load_nodes, save_nodes
+from 节点.node_store import NodeStore
 
 
 # ========== 定义 Node ==========
@@ -41,9 +45,27 @@ class NodeLoader:
         model_cls: Type[BaseModel] = MineruNode,
         separators=None,
         chunk_size: int = 512,
-        over_lap: int = 0
+        over_lap: int = 0,
+        tokenize_once: bool = False,
+        token_cache: Optional[TokenLengthCache] = None
     ):
+        """
+        tokenize_once: 为 True 时分块器对每段文本只 encode 一次，
+                       片段 token 数按 offset 查表（不含 special tokens），
+                       chunk 边界可能与默认模式不同，见 RecursiveTokenChunker
+        token_cache: 可选的 token 长度缓存，loader 和分块器共用；
+                     同一 tokenizer 的多个 loader 也可以传同一个实例
+        """
         self.tokenizer = tokenizer
+        self.token_cache = token_cache
+        if token_cache is not None:
+            namespace = TokenLengthCache.tokenizer_namespace(tokenizer)
+            self._huggingface_tokenizer_length = token_cache.wrap(
+                self._huggingface_tokenizer_length, namespace
+            )
+            self._huggingface_tokenizer_batch_length = token_cache.wrap_batch(
+                self._huggingface_tokenizer_batch_length, namespace
+            )
         self.model_cls = model_cls
         self.chunk_size = chunk_size
         self.over_lap = over_lap
@@ -51,7 +73,9 @@ class NodeLoader:
             chunk_size=chunk_size,
             chunk_overlap=over_lap,
             separators=separators,
-            length_function=self._huggingface_tokenizer_length
+            length_function=self._huggingface_tokenizer_length,
+            batch_length_function=self._huggingface_tokenizer_batch_length,
+            tokenizer=tokenizer if tokenize_once else None
         )
 
     # ====== 工具方法 ======
@@ -59,6 +83,17 @@ class NodeLoader:
         """计算文本的 token 数量"""
         return len(self.tokenizer.encode(text)) if text else 0
 
+    def _huggingface_tokenizer_batch_length(self, texts: List[Optional[str]], batch_size: int = 1024) -> List[int]:
+        """批量计算 token 数量：一次把一批字符串交给 fast tokenizer，结果与逐条 encode 一致"""
+        counts = [0] * len(texts)
+        todo = [i for i, t in enumerate(texts) if t]
+        for b in range(0, len(todo), batch_size):
+            idx = todo[b:b + batch_size]
+            input_ids = self.tokenizer([texts[i] for i in idx])["input_ids"]
+            for i, ids in zip(idx, input_ids):
+                counts[i] = len(ids)
+        return counts
+
     def normalize(self, value, sep: str = "\n") -> Optional[str]:
         """将 list / str 统一转成字符串"""
         if value is None:
@@ -68,149 +103,269 @@ class NodeLoader:
         return str(value)
 
     # ====== 从 mineru 输出加载 ======
+    def _content_for_count(self, item: Dict[str, Any]) -> Optional[str]:
+        """mineru 条目中参与 token 计数的内容"""
+        node_type = item.get("type")
+        if node_type == "text":
+            return item.get("text")
+        if node_type in ("image", "table"):
+            caption = self.normalize(item.get(f"{node_type}_caption"))
+            footnote = self.normalize(item.get(f"{node_type}_footnote"))
+            return " ".join(filter(None, [caption, footnote]))
+        return None
+
     def load_from_mineru(self, file_path: str) -> List[BaseModel]:
         """
         将 JSON 的 dict list 转换为模型类对象列表
         - text: 超过阈值会自动切分成多个 chunk
         - image/table: 保留 caption/footnote，并计算 token 数
+        - 逐批读取、批量计算 token，见 iter_from_mineru
+        """
+        return list(self.iter_from_mineru(file_path))
+
+    def iter_from_mineru(self, file_path: str, batch_size: int = 1024) -> Iterator[BaseModel]:
+        """
+        load_from_mineru 的流式版本：逐条解析 mineru 的 JSON 数组并产出节点，
+        每攒够 batch_size 条批量计算一次 token，峰值内存只和 batch_size 有关，与文件大小无关。
         """
-        data = self.load_from_file(file_path)
-        nodes, id_count = [], 0
-
-        for item in data:
-            node_type = item.get("type")
-            mineru_id = item.get("id")
-
-            # --- 文本节点 ---
-            if node_type == "text":
-                text = item.get("text")
-                token_count = self._huggingface_tokenizer_length(text)
-
-                if token_count > self.chunk_size:
-                    chunks = self.chunker.split_text(text)
-                    for chunk in chunks:
-                        nodes.append(self.model_cls(
-                            mineru_id=mineru_id,
-                            id=id_count,
-                            type="text",
-                            text=chunk,
-                            page_idx=item.get("page_idx"),
-                            token_count=self._huggingface_tokenizer_length(chunk),
-                        ))
-                        id_count += 1
-                else:
+        id_count = 0
+        for batch in self._batched(iter_json_array(file_path), batch_size):
+            token_counts = self._huggingface_tokenizer_batch_length(
+                [self._content_for_count(item) for item in batch]
+            )
+            for item, token_count in zip(batch, token_counts):
+                for node in self._item_to_nodes(item, token_count, id_count):
+                    id_count += 1
+                    yield node
+
+    def load_into_store(self, file_path: str, store: Optional[NodeStore] = None) -> NodeStore:
+        """流式加载到列式 NodeStore，不同时保留全部模型对象；节点以视图形式访问"""
+        store = store if store is not None else NodeStore(self.model_cls)
+        return store.extend(self.iter_from_mineru(file_path))
+
+    @staticmethod
+    def _batched(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _item_to_nodes(self, item: Dict[str, Any], token_count: int, id_count: int) -> List[BaseModel]:
+        """单个 mineru 条目转换成节点（text 超长时为多个），id 从 id_count 开始递增"""
+        node_type = item.get("type")
+        mineru_id = item.get("id")
+        nodes = []
+
+        # --- 文本节点 ---
+        if node_type == "text":
+            text = item.get("text")
+
+            if token_count > self.chunk_size:
+                chunks = self.chunker.split_text(text)
+                chunk_counts = self._huggingface_tokenizer_batch_length(chunks)
+                for chunk, chunk_count in zip(chunks, chunk_counts):
                     nodes.append(self.model_cls(
                         mineru_id=mineru_id,
-                        id=id_count,
+                        id=id_count + len(nodes),
                         type="text",
-                        text=text,
+                        text=chunk,
                         page_idx=item.get("page_idx"),
-                        token_count=token_count,
+                        token_count=chunk_count,
                     ))
-                    id_count += 1
-
-            # --- 图片节点 ---
-            elif node_type == "image":
-                caption = self.normalize(item.get("image_caption"))
-                footnote = self.normalize(item.get("image_footnote"))
-                content_for_count = " ".join(filter(None, [caption, footnote]))
-
+            else:
                 nodes.append(self.model_cls(
                     mineru_id=mineru_id,
                     id=id_count,
-                    type="image",
-                    caption=caption,
-                    footnote=footnote,
-                    img_path=item.get("img_path"),
+                    type="text",
+                    text=text,
                     page_idx=item.get("page_idx"),
-                    token_count=self._huggingface_tokenizer_length(content_for_count),
+                    token_count=token_count,
                 ))
-                id_count += 1
 
-            # --- 表格节点 ---
-            elif node_type == "table":
-                caption = self.normalize(item.get("table_caption"))
-                footnote = self.normalize(item.get("table_footnote"))
-                content_for_count = " ".join(filter(None, [caption, footnote]))
-
-                nodes.append(self.model_cls(
-                    mineru_id=mineru_id,
-                    id=id_count,
-                    type="table",
-                    caption=caption,
-                    footnote=footnote,
-                    img_path=item.get("img_path"),
-                    page_idx=item.get("page_idx"),
-                    token_count=self._huggingface_tokenizer_length(content_for_count),
-                ))
-                id_count += 1
+        # --- 图片节点 ---
+        elif node_type == "image":
+            caption = self.normalize(item.get("image_caption"))
+            footnote = self.normalize(item.get("image_footnote"))
+
+            nodes.append(self.model_cls(
+                mineru_id=mineru_id,
+                id=id_count,
+                type="image",
+                caption=caption,
+                footnote=footnote,
+                img_path=item.get("img_path"),
+                page_idx=item.get("page_idx"),
+                token_count=token_count,
+            ))
+
+        # --- 表格节点 ---
+        elif node_type == "table":
+            caption = self.normalize(item.get("table_caption"))
+            footnote = self.normalize(item.get("table_footnote"))
+
+            nodes.append(self.model_cls(
+                mineru_id=mineru_id,
+                id=id_count,
+                type="table",
+                caption=caption,
+                footnote=footnote,
+                img_path=item.get("img_path"),
+                page_idx=item.get("page_idx"),
+                token_count=token_count,
+            ))
 
         return nodes
 
     # ====== 合并相同 mineru_id 的 text 节点 ======
-    def merge_text_nodes(self, nodes: List[BaseModel]) -> List[BaseModel]:
-        merged_nodes: List[BaseModel] = []
-        current_group: List[BaseModel] = []
-
-        def flush_group():
-            if not current_group:
-                return
-            merged_text = "\n".join([n.text for n in current_group if n.text])
-            token_count = self._huggingface_tokenizer_length(merged_text)
-            new_node = current_group[0].copy(update={
-                "id": current_group[0].mineru_id,
-                "token_count": token_count
-            })
-            merged_nodes.append(new_node)
-            current_group.clear()
+    def merge_text_nodes(self, nodes: Iterable[BaseModel], verify: bool = True) -> List[BaseModel]:
+        """合并连续且 mineru_id 相同的 text 节点，见 iter_merge_text_nodes；传入的 text 节点不会被修改"""
+        return list(self.iter_merge_text_nodes(nodes, verify=verify))
+
+    def iter_merge_text_nodes(
+        self, nodes: Iterable[BaseModel], verify: bool = True, batch_size: int = 1024
+    ) -> Iterator[BaseModel]:
+        """
+        单遍流式合并：连续且 mineru_id 相同的 text 节点合成一个，文本用 "\n" 拼接。
+        - 每组产出组内第一个节点的副本（每组复制一次），传入的 text 节点不被修改；
+          非 text 节点原样产出，id 原地改为 mineru_id
+        - verify=True（默认）时对合并文本重新批量计数（每 batch_size 组一次），token_count 是精确值
+        - verify=False 时 token 数由成员的 token_count 推出，是估计值：
+          去掉各自的 special tokens 后求和，加上分隔符的 token 数，再加一次 special tokens；
+          拼接处的切分可能与整体 encode 不同，约三分之一的组会差 1-3 个 token，
+          token_count 要用于分块预算时不要关闭 verify；成员缺少 token_count 的组总是重新计数
+        - 成员文本全为空时合并结果为空串，token 数为 0
+        """
+        buffer: List[BaseModel] = []          # 待产出的节点
+        exact: List[Tuple[int, str]] = []     # 需要重新计数的 (buffer 下标, 合并文本)
+        group: List[BaseModel] = []
+
+        def flush_buffer() -> List[BaseModel]:
+            nonlocal buffer, exact
+            if exact:
+                token_counts = self._huggingface_tokenizer_batch_length([t for _, t in exact])
+                for (i, _), token_count in zip(exact, token_counts):
+                    buffer[i].token_count = token_count
+            ready, buffer, exact = buffer, [], []
+            return ready
 
         for node in nodes:
+            if node.type == "text" and (not group or node.mineru_id == group[0].mineru_id):
+                group.append(node)
+                continue
+            if group:
+                merged, merged_text = self._merge_group(group, verify)
+                if merged_text is not None:
+                    exact.append((len(buffer), merged_text))
+                buffer.append(merged)
+                group = []
             if node.type == "text":
-                if not current_group or node.mineru_id == current_group[0].mineru_id:
-                    current_group.append(node)
-                else:
-                    flush_group()
-                    current_group.append(node)
+                group.append(node)
             else:
-                flush_group()
                 node.id = node.mineru_id  # 非 text 节点也保证 id 和 mineru_id 一致
-                merged_nodes.append(node)
-
-        flush_group()
-        return merged_nodes
+                buffer.append(node)
+            if not exact or len(exact) >= batch_size:
+                yield from flush_buffer()
+
+        if group:
+            merged, merged_text = self._merge_group(group, verify)
+            if merged_text is not None:
+                exact.append((len(buffer), merged_text))
+            buffer.append(merged)
+        yield from flush_buffer()
+
+    def _merge_token_costs(self) -> Tuple[int, int]:
+        """
+        (special tokens 数, 拼接处 "\n" 带来的 token 数)，每个 tokenizer 只算一次。
+        分隔符的代价在上下文中测：sentencepiece 类 tokenizer 单独编码时每段开头有 "▁"，
+        拼接后由换行顶替，只看 "\n" 本身的 token 数会多算。
+        """
+        costs = getattr(self, "_merge_costs", None)
+        if costs is None:
+            probe = len(self.tokenizer.encode("a", add_special_tokens=False))
+            joined = len(self.tokenizer.encode("a\na", add_special_tokens=False))
+            costs = (len(self.tokenizer.encode("")), joined - 2 * probe)
+            self._merge_costs = costs
+        return costs
+
+    def _merge_group(self, group: List[BaseModel], verify: bool) -> Tuple[BaseModel, Optional[str]]:
+        """
+        返回 (合并结果, 需要重新计数的合并文本)；合并结果是 group[0] 的副本，id 为 mineru_id，
+        text / token_count 为合并后的值。token 数已确定时第二项为 None
+        """
+        head = group[0].model_copy(update={"id": group[0].mineru_id})
+        if len(group) == 1:
+            if head.token_count is None or (head.token_count <= 0 and head.text):
+                return head, head.text or ""
+            return head, None
+
+        members = [n for n in group if n.text]
+        merged_text = "\n".join(n.text for n in members)
+        head.text = merged_text
+        if not members:
+            head.token_count = 0
+            return head, None
+        if verify or any(not n.token_count for n in members):
+            return head, merged_text
+        specials, separator_cost = self._merge_token_costs()
+        head.token_count = (
+            sum(n.token_count - specials for n in members)
+            + separator_cost * (len(members) - 1)
+            + specials
+        )
+        return head, None
 
     # ====== 从 JSON 文件加载 ======
     def load_for_model(self, path: Union[str, "PathLike"]) -> List[BaseModel]:
-        """从 JSON 文件加载并转换为模型类对象列表（不做任何 chunk 处理）"""
+        """从 JSON / JSONL 文件加载并转换为模型类对象列表（不做任何 chunk 处理）"""
         path = Path(path)
         if not path.exists():
             raise FileNotFoundError(f"文件不存在: {path}")
 
+        if path.suffix == ".jsonl":
+            return load_nodes(path, self.model_cls)
+
         try:
-            with path.open("r", encoding="utf-8") as f:
+            with gc_paused(), path.open("r", encoding="utf-8") as f:
                 raw_list = json.load(f)
         except json.JSONDecodeError as e:
             raise ValueError(f"JSON 格式错误: {path}") from e
 
         adapter = TypeAdapter(List[self.model_cls])
-        return adapter.validate_python(raw_list)
+        with gc_paused():
+            return adapter.validate_python(raw_list)
+
+    def iter_for_model(self, path: Union[str, "PathLike"]) -> Iterator[BaseModel]:
+        """load_for_model 的流式版本：逐条解析、逐条校验，不同时持有全部 dict 和模型对象"""
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"文件不存在: {path}")
+
+        try:
+            for item in iter_json_array(path):
+                yield self.model_cls.model_validate(item)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON 格式错误: {path}") from e
 
     # ====== 原始 JSON 数据读取 ======
     def load_from_file(self, file_path: str) -> List[Dict[str, Any]]:
         with open(file_path, "r", encoding="utf-8") as f:
             return json.load(f)
 
-    # ====== 保存到 JSON 文件 ======
+    # ====== 保存到 JSON / JSONL 文件 ======
     def save_to_file(self, nodes: List[BaseModel], file_path: str):
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump([node.model_dump() for node in nodes], f, ensure_ascii=False, indent=2)
+        """按扩展名选择格式：.jsonl 每行一个节点，其余沿用 indent=2 的 JSON 数组"""
+        save_nodes(nodes, file_path, "jsonl" if str(file_path).endswith(".jsonl") else "json")
 
     # ====== 计算 token ======
     def compute_token(self, nodes: List[BaseModel], field: str) -> List[BaseModel]:
-        for node in nodes:
-            if node.token_count == 0:
-                value = getattr(node, field)
-                node.token_count = self._huggingface_tokenizer_length(value)
+        pending = [node for node in nodes if node.token_count == 0]
+        token_counts = self._huggingface_tokenizer_batch_length([getattr(node, field) for node in pending])
+        for node, token_count in zip(pending, token_counts):
+            node.token_count = token_count
         return nodes
 
 
@@ -0,0 +1,88 @@
+"""
+节点持久化基准：原格式（indent=2 JSON + 整体校验）与 JSONL 的保存 / 加载耗时和文件大小。
+
+用法（在 不支持/ 目录下）：python -m 节点.bench_node_io [节点数，默认 1000000]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from 节点.base_node import MineruNode
+from 节点.node_io import convert_nodes, load_nodes, save_nodes
+
+
+def make_nodes(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(n):
+        kind = rng.choice(["text", "text", "text", "image", "table"])
+        nodes.append(MineruNode(
+            mineru_id=i,
+            id=i,
+            type=kind,
+            text="这是正文内容，包含一些 English words。" * rng.randint(1, 20) if kind == "text" else None,
+            caption="图表标题" if kind != "text" else None,
+            table="| a | b |\n| 1 | 2 |" if kind == "table" else None,
+            page_idx=i // 30,
+            token_count=rng.randint(1, 512),
+        ))
+    return nodes
+
+
+def _legacy_save(nodes, path):
+    import json
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([node.model_dump() for node in nodes], f, ensure_ascii=False, indent=2)
+
+
+def _legacy_load(path):
+    import json
+    from typing import List
+    from pydantic import TypeAdapter
+    with open(path, "r", encoding="utf-8") as f:
+        raw_list = json.load(f)
+    return TypeAdapter(List[MineruNode]).validate_python(raw_list)
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def bench(n: int):
+    nodes = make_nodes(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "nodes.json")
+        jsonl_path = os.path.join(tmp, "nodes.jsonl")
+
+        _, t_save_legacy = _timed(_legacy_save, nodes, json_path)
+        _, t_save_jsonl = _timed(save_nodes, nodes, jsonl_path)
+        del nodes
+
+        loaded, t_load_legacy = _timed(_legacy_load, json_path)
+        del loaded
+        loaded, t_load_json = _timed(load_nodes, json_path, MineruNode)
+        del loaded
+        loaded, t_load_jsonl = _timed(load_nodes, jsonl_path, MineruNode)
+        del loaded
+
+        converted = os.path.join(tmp, "converted.json")
+        _, t_convert = _timed(convert_nodes, jsonl_path, converted)
+        with open(json_path, "rb") as a, open(converted, "rb") as b:
+            same = a.read() == b.read()
+
+        print(f"节点数 {n}")
+        print(f"{'':24s}{'保存':>8s}{'加载':>8s}{'大小(MB)':>10s}")
+        print(f"{'json indent=2 (原实现)':24s}{t_save_legacy:8.2f}{t_load_legacy:8.2f}"
+              f"{os.path.getsize(json_path) / 1e6:10.1f}")
+        print(f"{'json 流式加载 + 暂停 gc':24s}{'':8s}{t_load_json:8.2f}")
+        print(f"{'jsonl':24s}{t_save_jsonl:8.2f}{t_load_jsonl:8.2f}"
+              f"{os.path.getsize(jsonl_path) / 1e6:10.1f}")
+        print(f"jsonl -> json 转换 {t_convert:.2f}s，与原实现输出{'一致' if same else '不一致'}")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
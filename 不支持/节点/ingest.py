@@ -0,0 +1,198 @@
+"""
+目录级批量入库：
+- 递归查找目录下所有 *_content_list.json（mineru 输出）
+- 多进程处理，每个 worker 进程只加载一次 tokenizer / NodeLoader
+- 每篇文档：加载 + 分块 -> 合并同 mineru_id 的 text 节点 -> 写出 <文档名>_nodes.jsonl
+- 打印每个文件的耗时和节点数，以及总计，用来估算入库任务规模
+
+用法（在 不支持/ 目录下）：
+    python -m 节点.ingest mineru_output/ nodes_output/ --tokenizer BAAI/bge-m3 --workers 8
+"""
+import os
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from 分块.parallel import parallel_map
+from 节点.base_node import NodeLoader
+from 节点.node_io import save_nodes
+
+CONTENT_LIST_SUFFIX = "_content_list.json"
+
+
+def find_content_lists(root: str) -> List[Path]:
+    """目录下所有 mineru 的 content_list 文件，按路径排序"""
+    return sorted(Path(root).rglob(f"*{CONTENT_LIST_SUFFIX}"))
+
+
+class DirectoryIngestor:
+    """
+    只保存 tokenizer 名称和参数，可以廉价地 pickle 给 worker；
+    NodeLoader（连同 tokenizer）在每个进程第一次用到时创建，之后复用。
+    """
+
+    def __init__(
+        self,
+        tokenizer_name: str,
+        output_dir: str,
+        separators: Optional[Sequence[str]] = None,
+        chunk_size: int = 512,
+        over_lap: int = 0,
+        merge: bool = True,
+        fmt: str = "jsonl",
+        tokenize_once: bool = False,
+    ):
+        self.tokenizer_name = tokenizer_name
+        self.output_dir = output_dir
+        self.separators = list(separators) if separators is not None else None
+        self.chunk_size = chunk_size
+        self.over_lap = over_lap
+        self.merge = merge
+        self.fmt = fmt
+        self.tokenize_once = tokenize_once
+        self._input_root: Optional[Path] = None
+        self._loader: Optional[NodeLoader] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_loader"] = None
+        return state
+
+    @property
+    def loader(self) -> NodeLoader:
+        if self._loader is None:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+            self._loader = NodeLoader(
+                tokenizer,
+                separators=self.separators,
+                chunk_size=self.chunk_size,
+                over_lap=self.over_lap,
+                tokenize_once=self.tokenize_once,
+            )
+        return self._loader
+
+    def output_path(self, file_path: Path) -> Path:
+        """输出按输入目录下的相对位置存放，不同子目录里的同名文档不会互相覆盖"""
+        doc_name = file_path.name[: -len(CONTENT_LIST_SUFFIX)]
+        subdir = Path()
+        if self._input_root is not None:
+            subdir = file_path.parent.relative_to(self._input_root)
+        return Path(self.output_dir) / subdir / f"{doc_name}_nodes.{self.fmt}"
+
+    def ingest_file(self, file_path: Path) -> Dict[str, Any]:
+        """处理一篇文档；异常不会中断整个目录，记录在结果的 error 字段里"""
+        start = time.perf_counter()
+        result: Dict[str, Any] = {"file": str(file_path), "pid": os.getpid()}
+        try:
+            loader = self.loader
+            doc_name = file_path.name[: -len(CONTENT_LIST_SUFFIX)]
+            counts = {"nodes": 0, "output_nodes": 0}
+
+            def loaded() -> Iterator[Any]:
+                for node in loader.iter_from_mineru(str(file_path)):
+                    node.orignal_doc = doc_name
+                    counts["nodes"] += 1
+                    yield node
+
+            def counted(nodes: Iterator[Any]) -> Iterator[Any]:
+                for node in nodes:
+                    counts["output_nodes"] += 1
+                    yield node
+
+            # 加载 -> 合并 -> 写出全程流式，单篇文档再大也不会整篇驻留内存（json 格式除外）
+            nodes = loader.iter_merge_text_nodes(loaded()) if self.merge else loaded()
+            output = self.output_path(file_path)
+            output.parent.mkdir(parents=True, exist_ok=True)
+            save_nodes(counted(nodes), output, self.fmt)
+            result.update(output=str(output), **counts)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+            result["traceback"] = traceback.format_exc()
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def ingest_dir(
+        self, input_dir: str, workers: Optional[int] = None, verbose: bool = True
+    ) -> Dict[str, Any]:
+        """
+        处理目录下的全部文档，返回 {"files": [每个文件的结果], "totals": {...}}。
+        workers 为 1 时在当前进程顺序执行。
+        """
+        files = find_content_lists(input_dir)
+        self._input_root = Path(input_dir)
+        if verbose:
+            print(f"找到 {len(files)} 个 content_list 文件，workers={workers or os.cpu_count()}")
+
+        start = time.perf_counter()
+        results = []
+        for result in self._iter_results(files, workers):
+            results.append(result)
+            if verbose:
+                print(_format_result(result))
+        wall = time.perf_counter() - start
+
+        ok = [r for r in results if "error" not in r]
+        totals = {
+            "files": len(results),
+            "failed": len(results) - len(ok),
+            "nodes": sum(r["nodes"] for r in ok),
+            "output_nodes": sum(r["output_nodes"] for r in ok),
+            "wall_seconds": wall,
+            "worker_seconds": sum(r["seconds"] for r in results),
+        }
+        totals["nodes_per_second"] = totals["nodes"] / wall if wall > 0 else 0.0
+        if verbose:
+            print(
+                f"总计: {totals['files']} 个文件（失败 {totals['failed']}），"
+                f"{totals['nodes']} 个节点 -> {totals['output_nodes']} 个，"
+                f"耗时 {wall:.2f}s（各文件累计 {totals['worker_seconds']:.2f}s），"
+                f"{totals['nodes_per_second']:.0f} nodes/s"
+            )
+        return {"files": results, "totals": totals}
+
+    def _iter_results(self, files: List[Path], workers: Optional[int]) -> Iterator[Dict[str, Any]]:
+        if not files:
+            return iter(())
+        return parallel_map(self, "ingest_file", files, workers)
+
+
+def _format_result(result: Dict[str, Any]) -> str:
+    name = Path(result["file"]).name
+    if "error" in result:
+        return f"  [失败] {name}  {result['seconds']:.2f}s  {result['error']}"
+    return (
+        f"  {name}  {result['seconds']:.2f}s  "
+        f"{result['nodes']} -> {result['output_nodes']} 节点  (pid {result['pid']})"
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="并行处理目录下所有 mineru content_list 文件")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--tokenizer", default="BAAI/bge-m3")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=0)
+    parser.add_argument("--format", default="jsonl", choices=["json", "jsonl"])
+    parser.add_argument("--no-merge", action="store_true", help="不合并 mineru_id 相同的 text 节点")
+    parser.add_argument(
+        "--tokenize-once", action="store_true",
+        help="每篇文档只 encode 一次，更快，但 chunk 边界可能与默认模式不同",
+    )
+    args = parser.parse_args()
+
+    ingestor = DirectoryIngestor(
+        args.tokenizer,
+        args.output_dir,
+        chunk_size=args.chunk_size,
+        over_lap=args.overlap,
+        merge=not args.no_merge,
+        fmt=args.format,
+        tokenize_once=args.tokenize_once,
+    )
+    ingestor.ingest_dir(args.input_dir, workers=args.workers)
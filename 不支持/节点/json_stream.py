@@ -0,0 +1,79 @@
+"""
+流式读取顶层为数组的 JSON 文件（如 mineru 的 content_list.json）：
+- 按块读文件，用 json.JSONDecoder.raw_decode 逐个解析数组元素
+- 任一时刻只保留一个读缓冲区和当前元素，峰值内存与文件大小无关
+- 只依赖标准库
+"""
+import json
+import re
+from typing import Any, Iterator, Union
+from pathlib import Path
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json_array(path: Union[str, Path], buffer_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    逐个产出 JSON 数组中的元素。
+
+    Args:
+        path: JSON 文件路径，顶层必须是数组
+        buffer_size: 每次读取的字符数；单个元素超过它时缓冲区会自动变大
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(buffer_size)
+        pos = 0
+        eof = not buf
+
+        def fill() -> bool:
+            """丢掉已解析部分并追加一块，返回是否读到了新内容"""
+            nonlocal buf, pos, eof
+            chunk = f.read(buffer_size)
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip_ws() -> None:
+            nonlocal pos
+            while True:
+                pos = _WHITESPACE_RE.match(buf, pos).end()
+                if pos < len(buf) or not fill():
+                    return
+
+        skip_ws()
+        if pos >= len(buf) or buf[pos] != "[":
+            raise ValueError(f"JSON 顶层不是数组: {path}")
+        pos += 1
+
+        expect_value = True
+        while True:
+            skip_ws()
+            if pos >= len(buf):
+                raise ValueError(f"JSON 数组未闭合: {path}")
+            if buf[pos] == "]":
+                return
+            if not expect_value:
+                if buf[pos] != ",":
+                    raise ValueError(f"JSON 格式错误: {path}，位置附近: {buf[pos:pos + 50]!r}")
+                pos += 1
+                skip_ws()
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                    # 数字可能在缓冲区末尾被截断（如 "2." 被解析成 2），后面紧跟分隔符才算完整
+                    if eof or (end < len(buf) and buf[end] in _DELIMITERS):
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                if not fill():
+                    continue
+            pos = end
+            expect_value = False
+            yield item
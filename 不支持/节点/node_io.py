@@ -0,0 +1,180 @@
+"""
+节点 / 树的持久化：
+- .json ：原格式，indent=2 的 JSON（节点列表为数组，树为 {"root_id", "nodes"}），兼容旧文件
+- .jsonl：每行一条记录，用 pydantic 的 model_dump_json / model_validate_json（Rust 实现）逐行读写，
+          可流式处理；树文件第一行是 {"root_id": ...}，之后每行一个节点
+- 批量加载时暂停 gc：一次性创建几十万个小对象会让分代 gc 反复全量扫描，这是原格式加载的主要开销
+- 两种格式之间的转换只搬运 dict，不经过模型类
+
+用法（在 不支持/ 目录下）：python -m 节点.node_io src.json dst.jsonl [--tree]
+"""
+import gc
+import json
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel
+
+from 节点.json_stream import iter_json_array
+
+PathLike = Union[str, Path]
+# 与 model_dump_json 的输出保持一致
+_COMPACT = (",", ":")
+
+
+@contextmanager
+def gc_paused():
+    """暂停自动 gc，退出时恢复原状态"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _format_of(path: PathLike, fmt: Optional[str]) -> str:
+    fmt = fmt or Path(path).suffix.lstrip(".").lower()
+    if fmt not in ("json", "jsonl"):
+        raise ValueError(f"不支持的格式: {fmt}（可选 json / jsonl）")
+    return fmt
+
+
+# ========== 节点列表 ==========
+
+def save_nodes(nodes: Iterable[BaseModel], path: PathLike, fmt: Optional[str] = None) -> None:
+    """按扩展名（或 fmt）保存节点列表；jsonl 可直接接收生成器"""
+    fmt = _format_of(path, fmt)
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            json.dump([node.model_dump() for node in nodes], f, ensure_ascii=False, indent=2)
+            return
+        for node in nodes:
+            f.write(node.model_dump_json())
+            f.write("\n")
+
+
+def iter_nodes(path: PathLike, model_cls: Type[BaseModel], fmt: Optional[str] = None) -> Iterator[BaseModel]:
+    """逐条读取并校验节点；两种格式都不会一次性读入整个文件"""
+    if _format_of(path, fmt) == "json":
+        for item in iter_json_array(path):
+            yield model_cls.model_validate(item)
+        return
+    # 按字节读行，直接交给 pydantic 解析，省掉一次 utf-8 解码
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield model_cls.model_validate_json(line)
+
+
+def load_nodes(path: PathLike, model_cls: Type[BaseModel], fmt: Optional[str] = None) -> List[BaseModel]:
+    with gc_paused():
+        return list(iter_nodes(path, model_cls, fmt))
+
+
+def _iter_records(path: PathLike, fmt: str) -> Iterator[Dict[str, Any]]:
+    if fmt == "json":
+        yield from iter_json_array(path)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def convert_nodes(src: PathLike, dst: PathLike) -> int:
+    """节点列表在 json / jsonl 之间转换，返回记录数"""
+    src_fmt, dst_fmt = _format_of(src, None), _format_of(dst, None)
+    count = 0
+    with open(dst, "w", encoding="utf-8") as f:
+        if dst_fmt == "json":
+            # 与 json.dump(..., indent=2) 的输出一致，但逐条写出
+            f.write("[")
+            for record in _iter_records(src, src_fmt):
+                f.write(",\n  " if count else "\n  ")
+                f.write(json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+                count += 1
+            f.write("\n]" if count else "]")
+        else:
+            for record in _iter_records(src, src_fmt):
+                f.write(json.dumps(record, ensure_ascii=False, separators=_COMPACT))
+                f.write("\n")
+                count += 1
+    return count
+
+
+# ========== 树 ==========
+
+def save_tree(root_id: str, nodes_dict: Dict[str, BaseModel], path: PathLike, fmt: Optional[str] = None) -> None:
+    fmt = _format_of(path, fmt)
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            data = {
+                "root_id": root_id,
+                "nodes": {nid: n.model_dump() for nid, n in nodes_dict.items()},
+            }
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            return
+        f.write(json.dumps({"root_id": root_id}, ensure_ascii=False))
+        f.write("\n")
+        for node in nodes_dict.values():
+            f.write(node.model_dump_json())
+            f.write("\n")
+
+
+def load_tree(
+    path: PathLike, model_cls: Type[BaseModel], fmt: Optional[str] = None
+) -> Tuple[str, Dict[str, BaseModel]]:
+    """返回 (root_id, nodes_dict)；jsonl 中节点以自身 id 为 key"""
+    fmt = _format_of(path, fmt)
+    with gc_paused(), open(path, "rb") as f:
+        if fmt == "json":
+            data = json.load(f)
+            nodes_dict = {nid: model_cls.model_validate(d) for nid, d in data["nodes"].items()}
+            return data["root_id"], nodes_dict
+        root_id = json.loads(f.readline())["root_id"]
+        nodes_dict = {}
+        for line in f:
+            if line.strip():
+                node = model_cls.model_validate_json(line)
+                nodes_dict[node.id] = node
+        return root_id, nodes_dict
+
+
+def convert_tree(src: PathLike, dst: PathLike) -> int:
+    """树文件在 json / jsonl 之间转换，返回节点数"""
+    src_fmt, dst_fmt = _format_of(src, None), _format_of(dst, None)
+    with gc_paused(), open(src, "r", encoding="utf-8") as f:
+        if src_fmt == "json":
+            data = json.load(f)
+            root_id, records = data["root_id"], list(data["nodes"].values())
+        else:
+            root_id = json.loads(f.readline())["root_id"]
+            records = [json.loads(line) for line in f if line.strip()]
+
+    with open(dst, "w", encoding="utf-8") as f:
+        if dst_fmt == "json":
+            data = {"root_id": root_id, "nodes": {r["id"]: r for r in records}}
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        else:
+            f.write(json.dumps({"root_id": root_id}, ensure_ascii=False))
+            f.write("\n")
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=_COMPACT))
+                f.write("\n")
+    return len(records)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="节点 / 树文件在 json 与 jsonl 之间转换")
+    parser.add_argument("src")
+    parser.add_argument("dst")
+    parser.add_argument("--tree", action="store_true", help="输入是 save_tree_json 保存的树")
+    args = parser.parse_args()
+
+    n = (convert_tree if args.tree else convert_nodes)(args.src, args.dst)
+    print(f"已转换 {n} 条记录: {args.src} -> {args.dst}")
@@ -0,0 +1,357 @@
+"""
+列式节点存储：
+- 百万级节点时，每个 pydantic 对象（连同它的 __dict__、字段值）的固定开销会占掉大部分内存
+- NodeStore 按模型类的字段建列：int 字段存 array('q')，重复度高的 str 字段（type / orignal_doc 等）
+  存成字符串表 + array('I') 编码，正文等普通 str 存在 list 里，其余类型原样存对象
+- parent / children 这类引用字段存的是行号（array），按 id 引用尚未加入的节点时先挂起，目标加入后回填
+- NodeView 是一行的轻量视图（两个槽位），读写属性、model_dump / model_dump_json 与原模型一致，
+  loader、分块器、build_tree 可以直接在视图上运行
+"""
+import json
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+_INT_NONE = -(1 << 63)   # int 列中表示 None
+_REF_NONE = -1           # 引用列中表示 None；小于 -1 的值表示尚未解析的 id（见 _unresolved）
+
+_KIND_INT, _KIND_STR, _KIND_INTERN, _KIND_REF, _KIND_REFS, _KIND_OBJ = range(6)
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    if get_origin(annotation) is Union:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+class NodeView:
+    """NodeStore 中一行的视图；属性读写直接落到列上"""
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: "NodeStore", row: int):
+        object.__setattr__(self, "_store", store)
+        object.__setattr__(self, "_row", row)
+
+    def __getattr__(self, name: str) -> Any:
+        return self._store.get_value(self._row, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        self._store.set_value(self._row, name, value)
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    def model_dump(self) -> Dict[str, Any]:
+        return self._store.row_dict(self._row)
+
+    def model_dump_json(self) -> str:
+        return json.dumps(self.model_dump(), ensure_ascii=False, separators=(",", ":"))
+
+    def to_model(self) -> BaseModel:
+        """转换成真正的模型对象"""
+        return self._store.model_cls.model_validate(self.model_dump())
+
+    def model_copy(self, update: Optional[Dict[str, Any]] = None, deep: bool = False) -> BaseModel:
+        """与 BaseModel.model_copy 相同，返回脱离 store 的模型对象，修改它不影响 store"""
+        return self.to_model().model_copy(update=update, deep=deep)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, NodeView):
+            return self.model_dump() == other.model_dump()
+        if isinstance(other, BaseModel):
+            return self.model_dump() == other.model_dump()
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        fields = " ".join(f"{k}={v!r}" for k, v in self.model_dump().items())
+        return f"{self._store.model_cls.__name__}View(row={self._row} {fields})"
+
+
+class _IdMapping(Mapping):
+    """按 id 访问的只读映射（如 build_tree 返回的 nodes_dict），值是视图"""
+
+    def __init__(self, store: "NodeStore"):
+        self._store = store
+
+    def __getitem__(self, node_id: Any) -> NodeView:
+        return self._store.view(self._store.row_of(node_id))
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._store.ids())
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __contains__(self, node_id: Any) -> bool:
+        return node_id in self._store._row_of
+
+
+class NodeStore(Sequence):
+    """
+    Args:
+        model_cls: 列结构来自它的字段（MineruNode / IndexNode / 自定义子类）
+        id_field: 唯一标识字段，引用字段按它解析
+        ref_fields: 引用单个节点 id 的字段（如 parent）
+        ref_list_fields: 引用节点 id 列表的字段（如 children）
+        intern_fields: 取值重复度高的 str 字段，存成字符串表编码
+    """
+
+    def __init__(
+        self,
+        model_cls: Type[BaseModel],
+        id_field: str = "id",
+        ref_fields: Sequence[str] = ("parent",),
+        ref_list_fields: Sequence[str] = ("children",),
+        intern_fields: Sequence[str] = ("type", "orignal_doc", "img_path"),
+    ):
+        self.model_cls = model_cls
+        self.id_field = id_field
+        self._fields: List[Tuple[str, int, Any]] = []   # (字段名, 列类型, 默认值)
+        self._columns: Dict[str, Any] = {}
+        self._kinds: Dict[str, int] = {}
+
+        for name, info in model_cls.model_fields.items():
+            annotation = _unwrap_optional(info.annotation)
+            if name == id_field:
+                kind = _KIND_OBJ
+            elif name in ref_fields:
+                kind = _KIND_REF
+            elif name in ref_list_fields:
+                kind = _KIND_REFS
+            elif annotation is int:
+                kind = _KIND_INT
+            elif annotation is str:
+                kind = _KIND_INTERN if name in intern_fields else _KIND_STR
+            else:
+                kind = _KIND_OBJ
+            default = None if info.is_required() else info.get_default(call_default_factory=True)
+            self._fields.append((name, kind, default))
+            self._kinds[name] = kind
+            if kind == _KIND_INT:
+                self._columns[name] = array("q")
+            elif kind == _KIND_INTERN:
+                self._columns[name] = array("I")
+            elif kind == _KIND_REF:
+                self._columns[name] = array("q")
+            elif kind == _KIND_REFS:
+                # 每行的子节点是 _child_rows[start:start+len]；重新赋值时追加一段新的
+                self._columns[name] = (array("q"), array("I"), array("q"))
+            else:
+                self._columns[name] = []
+
+        # 字符串表：编码 0 表示 None
+        self._strings: List[Optional[str]] = [None]
+        self._string_codes: Dict[str, int] = {}
+        self._row_of: Dict[Any, int] = {}
+        # 尚未出现的 id：编号 k 以 -(k + 2) 存在引用列里，等待者为 (字段名, 位置)
+        self._unresolved: List[Any] = []
+        self._unresolved_code: Dict[Any, int] = {}
+        self._waiting: Dict[Any, List[Tuple[str, int]]] = {}
+
+    # ====== 基本访问 ======
+    def __len__(self) -> int:
+        return len(self._columns[self.id_field])
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[NodeView, List[NodeView]]:
+        if isinstance(i, slice):
+            return [NodeView(self, k) for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("NodeStore index out of range")
+        return NodeView(self, i)
+
+    def __iter__(self) -> Iterator[NodeView]:
+        for i in range(len(self)):
+            yield NodeView(self, i)
+
+    def view(self, row: int) -> NodeView:
+        return NodeView(self, row)
+
+    def ids(self) -> List[Any]:
+        return self._columns[self.id_field]
+
+    def row_of(self, node_id: Any) -> int:
+        return self._row_of[node_id]
+
+    def by_id(self, node_id: Any) -> NodeView:
+        return NodeView(self, self._row_of[node_id])
+
+    def id_mapping(self) -> Mapping:
+        """{id: 视图} 的只读映射，不为每个节点建对象"""
+        return _IdMapping(self)
+
+    # ====== 编码 / 解码 ======
+    def _intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self._string_codes.get(value)
+        if code is None:
+            code = len(self._strings)
+            self._strings.append(value)
+            self._string_codes[value] = code
+        return code
+
+    def _ref_code(self, node_id: Any, field: str, pos: int) -> int:
+        if node_id is None:
+            return _REF_NONE
+        row = self._row_of.get(node_id)
+        if row is not None:
+            return row
+        code = self._unresolved_code.get(node_id)
+        if code is None:
+            code = len(self._unresolved)
+            self._unresolved.append(node_id)
+            self._unresolved_code[node_id] = code
+        self._waiting.setdefault(node_id, []).append((field, pos))
+        return -(code + 2)
+
+    def _ref_value(self, code: int) -> Any:
+        if code >= 0:
+            return self.ids()[code]
+        if code == _REF_NONE:
+            return None
+        return self._unresolved[-code - 2]
+
+    def _resolve(self, node_id: Any, row: int) -> None:
+        code = -(self._unresolved_code[node_id] + 2)
+        for field, pos in self._waiting.pop(node_id, ()):
+            column = self._columns[field] if self._kinds[field] == _KIND_REF else self._columns[field][2]
+            # 挂起之后该位置可能已被重新赋值
+            if column[pos] == code:
+                column[pos] = row
+
+    # ====== 写入 ======
+    def append(self, node: Union[BaseModel, NodeView, Dict[str, Any]]) -> NodeView:
+        """追加一个节点（模型对象 / 视图 / dict），返回它的视图"""
+        if isinstance(node, dict):
+            get = node.get
+        else:
+            get = lambda name, default=None: getattr(node, name, default)
+
+        node_id = get(self.id_field)
+        if node_id in self._row_of:
+            raise ValueError(f"重复的节点 id: {node_id!r}")
+        row = len(self)
+        for name, kind, default in self._fields:
+            value = get(name, default)
+            column = self._columns[name]
+            if kind == _KIND_INT:
+                column.append(_INT_NONE if value is None else value)
+            elif kind == _KIND_INTERN:
+                column.append(self._intern(value))
+            elif kind == _KIND_REF:
+                column.append(self._ref_code(value, name, row))
+            elif kind == _KIND_REFS:
+                starts, lengths, rows = column
+                if value is None:
+                    starts.append(-1)
+                    lengths.append(0)
+                else:
+                    starts.append(len(rows))
+                    lengths.append(len(value))
+                    for child_id in value:
+                        rows.append(self._ref_code(child_id, name, len(rows)))
+            else:
+                column.append(value)
+        self._row_of[node_id] = row
+        if node_id in self._waiting:
+            self._resolve(node_id, row)
+        return NodeView(self, row)
+
+    def extend(self, nodes: Iterable[Union[BaseModel, NodeView, Dict[str, Any]]]) -> "NodeStore":
+        for node in nodes:
+            self.append(node)
+        return self
+
+    @classmethod
+    def from_models(cls, nodes: Iterable[BaseModel], model_cls: Type[BaseModel], **kwargs: Any) -> "NodeStore":
+        return cls(model_cls, **kwargs).extend(nodes)
+
+    # ====== 按行读写字段 ======
+    def get_value(self, row: int, name: str) -> Any:
+        kind = self._kinds.get(name)
+        if kind is None:
+            raise AttributeError(f"{self.model_cls.__name__} 没有字段 {name!r}")
+        column = self._columns[name]
+        if kind == _KIND_INT:
+            value = column[row]
+            return None if value == _INT_NONE else value
+        if kind == _KIND_INTERN:
+            return self._strings[column[row]]
+        if kind == _KIND_REF:
+            return self._ref_value(column[row])
+        if kind == _KIND_REFS:
+            starts, lengths, rows = column
+            start = starts[row]
+            if start < 0:
+                return None
+            return [self._ref_value(c) for c in rows[start:start + lengths[row]]]
+        return column[row]
+
+    def set_value(self, row: int, name: str, value: Any) -> None:
+        kind = self._kinds.get(name)
+        if kind is None:
+            raise AttributeError(f"{self.model_cls.__name__} 没有字段 {name!r}")
+        if name == self.id_field:
+            old_id = self._columns[name][row]
+            if value != old_id:
+                if value in self._row_of:
+                    raise ValueError(f"重复的节点 id: {value!r}")
+                del self._row_of[old_id]
+                self._row_of[value] = row
+                self._columns[name][row] = value
+                if value in self._waiting:
+                    self._resolve(value, row)
+            return
+        column = self._columns[name]
+        if kind == _KIND_INT:
+            column[row] = _INT_NONE if value is None else value
+        elif kind == _KIND_INTERN:
+            column[row] = self._intern(value)
+        elif kind == _KIND_REF:
+            column[row] = self._ref_code(value, name, row)
+        elif kind == _KIND_REFS:
+            starts, lengths, rows = column
+            if value is None:
+                starts[row], lengths[row] = -1, 0
+                return
+            starts[row], lengths[row] = len(rows), len(value)
+            for child_id in value:
+                rows.append(self._ref_code(child_id, name, len(rows)))
+        else:
+            column[row] = value
+
+    def row_dict(self, row: int) -> Dict[str, Any]:
+        result = {}
+        for name, _, _ in self._fields:
+            value = self.get_value(row, name)
+            if isinstance(value, BaseModel):
+                value = value.model_dump()
+            result[name] = value
+        return result
+
+    # ====== 引用的行号形式（遍历树时不经过 id） ======
+    def parent_row(self, row: int, field: str = "parent") -> Optional[int]:
+        code = self._columns[field][row]
+        return code if code >= 0 else None
+
+    def child_rows(self, row: int, field: str = "children") -> List[int]:
+        starts, lengths, rows = self._columns[field]
+        start = starts[row]
+        if start < 0:
+            return []
+        return [c for c in rows[start:start + lengths[row]] if c >= 0]
+
+    def nbytes(self) -> int:
+        """各 array 列占用的字节数（不含 list 列里的对象）"""
+        total = 0
+        for column in self._columns.values():
+            for arr in (column if isinstance(column, tuple) else (column,)):
+                if isinstance(arr, array):
+                    total += arr.itemsize * len(arr)
+        return total
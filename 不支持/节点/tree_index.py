@@ -0,0 +1,391 @@
+"""
+树的二进制索引（.tidx），用于在线检索：
+- 打开时只 mmap 文件并读头部，不解析任何节点，启动耗时与树的大小无关
+- 每个节点一条定长记录：node_type、父节点行号、子节点区间、orignal_doc 编码、先序区间 enter / exit，
+  以及 text / summary / 其余字段（JSON）在文本区中的偏移和长度
+- id -> 行号 是开放寻址哈希表（crc32 + 线性探测），查找 O(1)，只比较命中槽位的 id 字节
+- 子节点行号是一个连续的 uint32 数组，父子关系都按行号走，不需要解码 id；
+  不在树中的 children（叶子保留的 MinerU 源节点 id）不编码成行号，原样存在 extra JSON 里
+- 文本只有在访问 .text / .summary 等属性时才从 mmap 中解码
+
+文件布局（小端）：头部 | 记录区 | 子节点数组 | 哈希表 | id 偏移 | id 字节 | 文本区 | 元信息 JSON
+
+用法（在 不支持/ 目录下）：python -m 节点.tree_index tree.json tree.tidx
+会把 save_tree_json 保存的树转成索引，并对比两种方式的打开耗时和按 id 取文本的耗时。
+"""
+import json
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from 节点.node_io import PathLike
+
+MAGIC = b"TIDX"
+VERSION = 2
+
+# magic, version, 节点数, 根节点行号, 哈希表槽位数, 各区偏移（记录/子节点/哈希表/id 偏移/id 字节/文本/元信息）, 元信息长度
+_HEADER = struct.Struct("<4sIIiI7QQ")
+# node_type, 父节点行号, 子节点起点, 子节点个数, orignal_doc 编码, enter, exit,
+# 然后是 text / summary / extra 的 (偏移, 长度)
+_RECORD = struct.Struct("<iiIIIii" + "QI" * 3)
+_LAZY_FIELDS = ("text", "summary")
+_STRUCT_FIELDS = ("id", "node_type", "parent", "children", "orignal_doc", "enter", "exit")
+_NONE = 0xFFFFFFFF      # 长度为该值表示字段为 None
+_NO_ROW = -1
+_NO_INT = -1            # enter / exit 为 None
+
+
+def _hash(id_bytes: bytes) -> int:
+    return zlib.crc32(id_bytes)
+
+
+def _pack(typecode: str, values: List[int]) -> bytes:
+    data = array(typecode, values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _table_size(count: int) -> int:
+    size = 8
+    while size < count * 2:
+        size *= 2
+    return size
+
+
+def write_tree_index(root_id: str, nodes_dict: Dict[str, Any], path: PathLike) -> int:
+    """把 (root_id, nodes_dict) 写成索引文件，返回节点数；nodes_dict 的值是模型或 NodeView"""
+    ids = list(nodes_dict)
+    row_of = {node_id: row for row, node_id in enumerate(ids)}
+    if root_id not in row_of:
+        raise KeyError(f"root_id {root_id!r} 不在 nodes_dict 中")
+
+    docs: List[Optional[str]] = [None]       # 编码 0 表示 None
+    doc_codes: Dict[str, int] = {}
+    extra_fields: List[str] = []
+    records, children, blob = bytearray(), [], bytearray()
+
+    def put(value: Optional[str]) -> Tuple[int, int]:
+        if value is None:
+            return 0, _NONE
+        data = value.encode("utf-8")
+        offset = len(blob)
+        blob.extend(data)
+        return offset, len(data)
+
+    for node_id in ids:
+        d = nodes_dict[node_id].model_dump()
+        doc = d.get("orignal_doc")
+        if doc is None:
+            doc_code = 0
+        else:
+            doc_code = doc_codes.get(doc)
+            if doc_code is None:
+                doc_code = doc_codes[doc] = len(docs)
+                docs.append(doc)
+        child_ids = d.get("children") or []
+        child_rows = [row_of[c] for c in child_ids if c in row_of]
+        start = len(children)
+        children.extend(child_rows)
+        extra = {k: v for k, v in d.items() if k not in _STRUCT_FIELDS and k not in _LAZY_FIELDS}
+        for k in extra:
+            if k not in extra_fields:
+                extra_fields.append(k)
+        extra = {k: v for k, v in extra.items() if v is not None}
+        if len(child_rows) != len(child_ids):
+            extra["children"] = child_ids
+        lazy = [put(d.get(k)) for k in _LAZY_FIELDS]
+        lazy.append(put(json.dumps(extra, ensure_ascii=False, separators=(",", ":")) if extra else None))
+        records += _RECORD.pack(
+            d.get("node_type") or 0,
+            row_of.get(d.get("parent"), _NO_ROW),
+            start,
+            len(child_rows) if d.get("children") is not None else _NONE,
+            doc_code,
+            _NO_INT if d.get("enter") is None else d["enter"],
+            _NO_INT if d.get("exit") is None else d["exit"],
+            *[x for pair in lazy for x in pair],
+        )
+
+    # id -> 行号 哈希表，槽位存 行号 + 1（0 为空）
+    id_bytes = [str(node_id).encode("utf-8") for node_id in ids]
+    table_size = _table_size(len(ids))
+    table = [0] * table_size
+    mask = table_size - 1
+    for row, data in enumerate(id_bytes):
+        slot = _hash(data) & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = row + 1
+    id_offsets, offset = [], 0
+    for data in id_bytes:
+        id_offsets.append(offset)
+        offset += len(data)
+    id_offsets.append(offset)
+
+    meta = json.dumps({"docs": docs, "extra_fields": extra_fields}, ensure_ascii=False).encode("utf-8")
+    sections = [
+        bytes(records),
+        _pack("I", children),
+        _pack("I", table),
+        _pack("Q", id_offsets),
+        b"".join(id_bytes),
+        bytes(blob),
+        meta,
+    ]
+    offsets, pos = [], _HEADER.size
+    for section in sections:
+        offsets.append(pos)
+        pos += len(section)
+    header = _HEADER.pack(MAGIC, VERSION, len(ids), row_of[root_id], table_size, *offsets, len(meta))
+    with open(path, "wb") as f:
+        f.write(header)
+        for section in sections:
+            f.write(section)
+    return len(ids)
+
+
+class TreeIndexNode:
+    """索引中一个节点的只读视图；结构字段直接读定长记录，文本字段访问时才解码"""
+    __slots__ = ("_index", "_row")
+
+    def __init__(self, index: "TreeIndex", row: int):
+        self._index = index
+        self._row = row
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    @property
+    def id(self) -> str:
+        return self._index.id_of(self._row)
+
+    @property
+    def node_type(self) -> int:
+        return self._index._record(self._row)[0]
+
+    @property
+    def parent(self) -> Optional[str]:
+        row = self._index.parent_row(self._row)
+        return None if row is None else self._index.id_of(row)
+
+    @property
+    def children(self) -> Optional[List[str]]:
+        record = self._index._record(self._row)
+        if record[3] == _NONE:
+            return None
+        if record[12] != _NONE:
+            source_ids = self._index._extra(self._row).get("children")
+            if source_ids is not None:
+                return source_ids
+        return [self._index.id_of(r) for r in self._index.child_rows(self._row)]
+
+    @property
+    def orignal_doc(self) -> Optional[str]:
+        return self._index._docs[self._index._record(self._row)[4]]
+
+    @property
+    def enter(self) -> Optional[int]:
+        value = self._index._record(self._row)[5]
+        return None if value == _NO_INT else value
+
+    @property
+    def exit(self) -> Optional[int]:
+        value = self._index._record(self._row)[6]
+        return None if value == _NO_INT else value
+
+    @property
+    def text(self) -> Optional[str]:
+        return self._index._lazy(self._row, 0)
+
+    @property
+    def summary(self) -> Optional[str]:
+        return self._index._lazy(self._row, 1)
+
+    def __getattr__(self, name: str) -> Any:
+        if name in self._index._extra_fields:
+            return self._index._extra(self._row).get(name)
+        raise AttributeError(name)
+
+    def model_dump(self) -> Dict[str, Any]:
+        """字段顺序与 IndexNode 一致，其余字段按写入时出现的顺序排在后面"""
+        d = {
+            "id": self.id,
+            "node_type": self.node_type,
+            "summary": self.summary,
+            "text": self.text,
+            "children": self.children,
+            "parent": self.parent,
+            "orignal_doc": self.orignal_doc,
+        }
+        extra = self._index._extra(self._row)
+        for name in self._index._extra_fields:
+            d[name] = extra.get(name)
+        d["enter"] = self.enter
+        d["exit"] = self.exit
+        return d
+
+    def to_model(self, model_cls: Type[BaseModel]) -> BaseModel:
+        return model_cls.model_validate(self.model_dump())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, TreeIndexNode):
+            return self._index is other._index and self._row == other._row
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((id(self._index), self._row))
+
+    def __repr__(self) -> str:
+        return f"TreeIndexNode(row={self._row} id={self.id!r} node_type={self.node_type})"
+
+
+class TreeIndex(Mapping):
+    """
+    只读打开 .tidx 文件；作为 id -> TreeIndexNode 的映射，可以代替 load_tree_json 返回的 nodes_dict。
+    文件和 mmap 归调用方所有（包括 load_tree_json 返回的索引），用完调用 close()，或用 with 语句；
+    close() 之后不能再访问取出的节点。
+    child_rows 只包含树中的子节点，TreeIndexNode.children 则与写入时的 children 相同。
+    """
+
+    def __init__(self, path: PathLike):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        (magic, version, self._count, self._root_row, self._table_size,
+         self._records_off, self._children_off, self._table_off, self._id_offsets_off,
+         self._ids_off, self._blob_off, meta_off, meta_len) = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} 不是 v{VERSION} 的树索引文件")
+        meta = json.loads(self._mm[meta_off:meta_off + meta_len])
+        self._docs: List[Optional[str]] = meta["docs"]
+        self._extra_fields: List[str] = meta["extra_fields"]
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self._file.close()
+
+    def __enter__(self) -> "TreeIndex":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    # ---------- 按行号访问 ----------
+
+    def _record(self, row: int) -> Tuple[int, ...]:
+        return _RECORD.unpack_from(self._mm, self._records_off + row * _RECORD.size)
+
+    def _lazy(self, row: int, k: int) -> Optional[str]:
+        record = self._record(row)
+        offset, length = record[7 + 2 * k], record[8 + 2 * k]
+        if length == _NONE:
+            return None
+        start = self._blob_off + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _extra(self, row: int) -> Dict[str, Any]:
+        raw = self._lazy(row, len(_LAZY_FIELDS))
+        return json.loads(raw) if raw is not None else {}
+
+    def _id_bytes(self, row: int) -> bytes:
+        start, end = struct.unpack_from("<2Q", self._mm, self._id_offsets_off + row * 8)
+        return self._mm[self._ids_off + start:self._ids_off + end]
+
+    def id_of(self, row: int) -> str:
+        return self._id_bytes(row).decode("utf-8")
+
+    def parent_row(self, row: int) -> Optional[int]:
+        parent = self._record(row)[1]
+        return None if parent == _NO_ROW else parent
+
+    def child_rows(self, row: int) -> List[int]:
+        record = self._record(row)
+        start, count = record[2], record[3]
+        if count == _NONE or count == 0:
+            return []
+        return list(struct.unpack_from(f"<{count}I", self._mm, self._children_off + start * 4))
+
+    def view(self, row: int) -> TreeIndexNode:
+        if not 0 <= row < self._count:
+            raise IndexError(row)
+        return TreeIndexNode(self, row)
+
+    # ---------- 按 id 访问 ----------
+
+    def row_of(self, node_id: str) -> int:
+        data = str(node_id).encode("utf-8")
+        mask = self._table_size - 1
+        slot = _hash(data) & mask
+        while True:
+            (entry,) = struct.unpack_from("<I", self._mm, self._table_off + slot * 4)
+            if entry == 0:
+                raise KeyError(node_id)
+            if self._id_bytes(entry - 1) == data:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    @property
+    def root(self) -> TreeIndexNode:
+        return TreeIndexNode(self, self._root_row)
+
+    @property
+    def root_id(self) -> str:
+        return self.id_of(self._root_row)
+
+    def __getitem__(self, node_id: str) -> TreeIndexNode:
+        return TreeIndexNode(self, self.row_of(node_id))
+
+    def __contains__(self, node_id: Any) -> bool:
+        try:
+            self.row_of(node_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.id_of(row) for row in range(self._count))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    from 分块.tree import IndexNode
+    from 节点.node_io import load_tree
+
+    src, dst = sys.argv[1], sys.argv[2]
+    start = time.perf_counter()
+    root_id, nodes_dict = load_tree(src, IndexNode)
+    t_load = time.perf_counter() - start
+    n = write_tree_index(root_id, nodes_dict, dst)
+    print(f"已写入 {n} 个节点: {src} -> {dst}")
+
+    start = time.perf_counter()
+    index = TreeIndex(dst)
+    t_open = time.perf_counter() - start
+    sample = random.Random(0).sample(list(nodes_dict), min(1000, n))
+    start = time.perf_counter()
+    for node_id in sample:
+        assert index[node_id].text == nodes_dict[node_id].text
+    t_get = time.perf_counter() - start
+    print(f"load_tree: {t_load * 1000:.1f} ms；TreeIndex 打开: {t_open * 1000:.2f} ms；"
+          f"按 id 取 {len(sample)} 个节点文本: {t_get * 1000:.2f} ms")
+    index.close()
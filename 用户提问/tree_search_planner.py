@@ -1,24 +1,44 @@
 # -*- coding: utf-8 -*-
 # tree_search_planner.py
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+
+def subtree_intervals(hits: List[Dict[str, Any]]) -> Optional[List[Tuple[int, int]]]:
+    """命中节点的先序区间，重叠或相邻的合并；有命中缺少 enter / exit 时返回 None"""
+    if not hits or any(h.get("enter") is None or h.get("exit") is None for h in hits):
+        return None
+    # 与 不支持/分块/tree.py 的 merge_intervals 相同；检索端不在 不支持/ 的导入路径下，
+    # 且导入 tree.py 会带上 openai / pydantic 并在模块加载时创建 LLM client，所以这里保留一份
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted((h["enter"], h["exit"]) for h in hits):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
 
 
 class TreeAwareRetriever:
     """
     抽象接口（请用你的 Milvus 检索实现掉这3个方法）：
       - search_summary(query_text, book_id, top_k=5, extra_filters=None) -> List[Dict]
-      - search_detail_under(query_text, book_id, parent_ids, top_k=8) -> List[Dict]
+      - search_detail_under(query_text, book_id, parent_ids, top_k=8, intervals=None) -> List[Dict]
       - search_detail_global(query_text, book_id, top_k=8) -> List[Dict]
 
     命中建议包含字段：
-      id, parent_id(叶子), section_path(可选), text, score
+      id, parent_id(叶子), section_path(可选), text, score, enter / exit(先序区间)
+
+    intervals 是合并后的先序区间 [(enter, exit), ...]（summary 命中带 enter / exit 时由规划器给出），
+    "父节点下的全部叶子" 即 node_type == 0 and enter 落在任一区间内，
+    比按 parent_ids 逐层展开、再用长 id 列表过滤便宜；intervals 为 None 时退回 parent_ids
     """
     def search_summary(self, query_text: str, book_id: str, top_k: int = 5,
                        extra_filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         raise NotImplementedError
 
     def search_detail_under(self, query_text: str, book_id: str, parent_ids: List[str],
-                            top_k: int = 8) -> List[Dict[str, Any]]:
+                            top_k: int = 8, intervals: Optional[List[Tuple[int, int]]] = None
+                            ) -> List[Dict[str, Any]]:
         raise NotImplementedError
 
     def search_detail_global(self, query_text: str, book_id: str, top_k: int = 8
@@ -65,15 +85,13 @@ class TreeSearchPlanner:
             extra_filters={"section_hints": section_hints} if section_hints else None
         )
         if self._is_strong(sum_hits) or section_hints:
-            parent_ids = [h["id"] for h in sum_hits[: self.parent_fanout_max]]
-            det_hits = self.ret.search_detail_under(subq, book_id, parent_ids, top_k=self.detail_topk)
+            det_hits = self._detail_under(subq, book_id, sum_hits, top_k=self.detail_topk)
             if det_hits:
                 return {"mode": "summary→detail", "summary_hits": sum_hits,
                         "detail_hits": det_hits, "used_fallback": False}
             # 扩父节点扇出再试
             if len(sum_hits) > 1:
-                fan_ids = [h["id"] for h in sum_hits[: self.parent_fanout_max]]
-                det2 = self.ret.search_detail_under(subq, book_id, fan_ids, top_k=max(self.detail_topk, 12))
+                det2 = self._detail_under(subq, book_id, sum_hits, top_k=max(self.detail_topk, 12))
                 if det2:
                     return {"mode": "summary→detail(fanout)", "summary_hits": sum_hits,
                             "detail_hits": det2, "used_fallback": False}
@@ -90,9 +108,8 @@ class TreeSearchPlanner:
                 query_text=subq, book_id=book_id, top_k=self.parent_fanout_max,
                 extra_filters={"section_hints": section_hints}
             )
-            parent_ids = [h["id"] for h in sum_hits[: self.parent_fanout_max]] if sum_hits else []
-            if parent_ids:
-                det_hits = self.ret.search_detail_under(subq, book_id, parent_ids, top_k=self.detail_topk)
+            if sum_hits:
+                det_hits = self._detail_under(subq, book_id, sum_hits, top_k=self.detail_topk)
                 if det_hits:
                     return {"mode": "detail@hint-subtree", "summary_hits": sum_hits,
                             "detail_hits": det_hits, "used_fallback": False}
@@ -102,10 +119,17 @@ class TreeSearchPlanner:
             return {"mode": "detail-only", "summary_hits": [], "detail_hits": det_hits, "used_fallback": False}
         # 再借 summary 导航
         sum_hits = self.ret.search_summary(subq, book_id, top_k=self.parent_fanout_max)
-        parent_ids = [h["id"] for h in sum_hits[: self.parent_fanout_max]] if sum_hits else []
-        det2 = self.ret.search_detail_under(subq, book_id, parent_ids, top_k=max(self.detail_topk, 12))
+        det2 = self._detail_under(subq, book_id, sum_hits or [], top_k=max(self.detail_topk, 12))
         return {"mode": "summary→detail(recovery)", "summary_hits": sum_hits,
                 "detail_hits": det2, "used_fallback": True}
 
+    def _detail_under(self, subq: str, book_id: str, sum_hits: List[Dict[str, Any]],
+                      top_k: int) -> List[Dict[str, Any]]:
+        """在前 parent_fanout_max 个 summary 命中的子树里检索 detail，子树用合并后的先序区间表示"""
+        parents = sum_hits[: self.parent_fanout_max]
+        parent_ids = [h["id"] for h in parents]
+        return self.ret.search_detail_under(subq, book_id, parent_ids, top_k=top_k,
+                                            intervals=subtree_intervals(parents))
+
     def _is_strong(self, hits: List[Dict[str, Any]]) -> bool:
         return bool(hits) and hits[0].get("score", 0.0) >= self.min_summary_score